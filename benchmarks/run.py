@@ -0,0 +1,388 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Source lines per language, {i} is replaced by the line group number
+SNIPPETS = {
+    'bash': [
+        'function step_{i}() {{',
+        '    local value="$1"',
+        '    echo "step {i}: ${{value}}" | tr a-z A-Z',
+        '}}',
+    ],
+    'css': [
+        '.item-{i} > a:hover {{',
+        '    color: #{i:06x};',
+        '    margin: {i}px 0;',
+        '}}',
+    ],
+    'go': [
+        'func step{i}(value int) (int, error) {{',
+        '\tif value > {i} {{',
+        '\t\treturn 0, fmt.Errorf("too large: %d", value)',
+        '\t}}',
+        '\treturn value * {i}, nil',
+        '}}',
+    ],
+    'html': [
+        '<div class="item-{i}">',
+        '  <a href="/items/{i}">Item {i}</a>',
+        '  <!-- item {i} -->',
+        '</div>',
+    ],
+    'java': [
+        '    public int step{i}(int value) {{',
+        '        // step {i}',
+        '        return value * {i} + "{i}".length();',
+        '    }}',
+    ],
+    'javascript': [
+        'function step{i}(value) {{',
+        '  const result = value.map((x) => x * {i});',
+        '  return `step ${{result}} {i}`;',
+        '}}',
+    ],
+    'json': [
+        '  "key_{i}": {{"value": {i}, "name": "item {i}", "enabled": true}},',
+    ],
+    'markdown': [
+        '## Section {i}',
+        '',
+        'Some *emphasized* text and `code` for section {i}.',
+        '',
+        '- item {i}',
+        '',
+    ],
+    'python': [
+        'def step_{i}(value, factor={i}):',
+        '    """Step {i}."""',
+        '    return [x * factor for x in value if x]  # step {i}',
+        '',
+    ],
+    'rust': [
+        'fn step_{i}(value: &[i64]) -> Option<i64> {{',
+        '    // step {i}',
+        '    value.iter().map(|x| x * {i}).max()',
+        '}}',
+    ],
+    'sql': [
+        "SELECT id, name FROM items WHERE id = {i} AND name LIKE 'item {i}%';",
+    ],
+    'toml': [
+        '[section_{i}]',
+        'value = {i}',
+        'name = "item {i}"',
+        '',
+    ],
+    'xml': [
+        '<item id="{i}">',
+        '  <name>item {i}</name>',
+        '</item>',
+    ],
+    'yaml': [
+        'item_{i}:',
+        '  value: {i}',
+        '  name: "item {i}"',
+    ],
+}
+
+
+def create_flat(path, count):
+    path.mkdir(parents=True)
+    for i in range(count // 10):
+        (path / f'dir_{i:07}').mkdir()
+    for i in range(count - count // 10):
+        os.close(os.open(path / f'file_{i:07}.txt', os.O_CREAT | os.O_WRONLY))
+
+
+def create_deep(path, depth, width):
+    path.mkdir(parents=True)
+    level = [path]
+    for _ in range(depth):
+        next_level = []
+        for parent in level[:width]:
+            for i in range(width):
+                child = parent / f'dir_{i}'
+                child.mkdir()
+                (child / f'file_{i}.txt').write_text('deep\n')
+                next_level.append(child)
+        level = next_level
+
+
+def git(path, *args):
+    subprocess.run(
+        ['git', '-c', 'user.name=bench', '-c', 'user.email=bench@localhost', *args],
+        cwd=path,
+        check=True,
+        capture_output=True,
+    )
+
+
+def create_git_repo(path, count, modified, untracked):
+    path.mkdir(parents=True)
+    git(path, 'init', '-q')
+    for i in range(count):
+        (path / f'file_{i:06}.txt').write_text(f'line {i}\n')
+    (path / '.gitignore').write_text('*.log\n')
+    git(path, 'add', '-A')
+    git(path, 'commit', '-q', '-m', 'fixture')
+
+    for i in range(0, count, max(count // modified, 1))[:modified]:
+        (path / f'file_{i:06}.txt').write_text(f'changed {i}\n')
+    for i in range(untracked):
+        (path / f'untracked_{i:06}.txt').write_text(f'new {i}\n')
+        (path / f'ignored_{i:06}.log').write_text(f'log {i}\n')
+
+
+def create_sources(path, lines):
+    from fibro.preview import LANGUAGES
+
+    path.mkdir(parents=True)
+    sources = {}
+    for suffix, language in LANGUAGES.items():
+        if language in sources.values():
+            continue
+        snippet = SNIPPETS[language]
+        content = '\n'.join(
+            line.format(i=i)
+            for i in range(lines // len(snippet) + 1)
+            for line in snippet
+        )
+        (path / f'source{suffix}').write_text(content + '\n')
+        sources[f'source{suffix}'] = language
+    return sources
+
+
+def create_config(path):
+    # Use the bundled theme, regardless of the config of whoever runs this
+    path.joinpath('config/helix').mkdir(parents=True)
+    path.joinpath('config/helix/config.toml').write_text('theme = "default"\n')
+    os.environ['XDG_CONFIG_HOME'] = str(path / 'config')
+    os.environ['XDG_CACHE_HOME'] = str(path / 'cache')
+
+
+def elapsed(start):
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+async def wait_for(pilot, condition, timeout=600):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError('condition was not met in time')
+        await pilot.pause(0.001)
+
+
+def get_browser(app):
+    return app.query_one('Browser')
+
+
+async def bench_listing(path):
+    from fibro.app import App
+
+    start = time.perf_counter()
+    app = App(path)
+    async with app.run_test(size=(120, 40)) as pilot:
+        browser = get_browser(app)
+        await wait_for(pilot, lambda: len(browser.values) > 1)
+        first = elapsed(start)
+        await wait_for(pilot, lambda: not browser.listing)
+        return {'first_values_ms': first, 'listed_ms': elapsed(start)}
+
+
+async def bench_filter(path, query):
+    from fibro.app import App
+
+    app = App(path)
+    async with app.run_test(size=(120, 40)) as pilot:
+        browser = get_browser(app)
+        await wait_for(pilot, lambda: not browser.listing)
+
+        typing = []
+        for char in query:
+            start = time.perf_counter()
+            await pilot.press(char)
+            typing.append(elapsed(start))
+
+        deleting = []
+        for _ in query:
+            start = time.perf_counter()
+            await pilot.press('backspace')
+            deleting.append(elapsed(start))
+
+        return {'keystroke_ms': typing, 'backspace_ms': deleting}
+
+
+def is_previewed(app, path):
+    preview = app.query_one('Preview')
+    return preview.path == path and preview.preview[0] == 'document' and any(
+        child.__class__.__name__ == 'Highlight' for child in preview.children
+    )
+
+
+async def bench_preview(path, names):
+    from fibro.app import App
+
+    names = sorted(names)
+    start = time.perf_counter()
+    app = App(path / names[0])
+    async with app.run_test(size=(120, 40)) as pilot:
+        browser = get_browser(app)
+        await wait_for(pilot, lambda: not browser.listing)
+        await wait_for(pilot, lambda: is_previewed(app, path / names[0]))
+        first = elapsed(start)
+
+        moves = []
+        for name in names[1:]:
+            start = time.perf_counter()
+            await pilot.press('down')
+            await wait_for(pilot, lambda: is_previewed(app, path / name))
+            moves.append(elapsed(start))
+
+        # Going back should be served from the preview cache
+        back = []
+        for name in reversed(names[:-1]):
+            start = time.perf_counter()
+            await pilot.press('up')
+            await wait_for(pilot, lambda: is_previewed(app, path / name))
+            back.append(elapsed(start))
+
+        return {'first_preview_ms': first, 'move_ms': moves, 'move_back_ms': back}
+
+
+def bench_highlight(path, language):
+    from fibro import highlight
+
+    content = path.read_text()
+
+    start = time.perf_counter()
+    document = highlight.Document(content, content, language)
+    prepared = elapsed(start)
+
+    start = time.perf_counter()
+    document.get_block(0)
+    first_block = elapsed(start)
+
+    start = time.perf_counter()
+    document.get_block((len(document.lines) - 1) // highlight.BLOCK_SIZE)
+    last_block = elapsed(start)
+
+    # Changing a line in the middle has to be reparsed
+    lines = content.split('\n')
+    lines[len(lines) // 2] += ' '
+    changed = '\n'.join(lines)
+
+    start = time.perf_counter()
+    document = highlight.Document(content, changed, language, document)
+    document.get_block(0)
+    changed_ms = elapsed(start)
+
+    return {
+        'lines': len(document.lines),
+        'prepare_ms': prepared,
+        'first_block_ms': first_block,
+        'last_block_ms': last_block,
+        'reparse_ms': changed_ms,
+    }
+
+
+async def run(fixtures, args):
+    results = {}
+
+    def report(name, result):
+        results[name] = result
+        print(f'{name}: {json.dumps(result)}', file=sys.stderr)
+
+    for size in args.sizes:
+        path = fixtures / f'flat_{size}'
+        start = time.perf_counter()
+        create_flat(path, size)
+        print(f'created {path} in {elapsed(start)}ms', file=sys.stderr)
+
+        report(f'listing/flat_{size}', await bench_listing(path))
+        report(f'filter/flat_{size}', await bench_filter(path, 'file_1234'))
+
+    path = fixtures / 'deep'
+    create_deep(path, args.depth, 4)
+    report('listing/deep', await bench_listing(path))
+
+    path = fixtures / 'repo'
+    create_git_repo(path, args.repo_size, args.repo_size // 10, args.repo_size // 10)
+    report('listing/repo', await bench_listing(path))
+    report('filter/repo', await bench_filter(path, 'untracked_12'))
+
+    path = fixtures / 'sources'
+    sources = create_sources(path, args.lines)
+    report('preview/sources', await bench_preview(path, list(sources)))
+    for name, language in sources.items():
+        report(f'highlight/{language}', bench_highlight(path / name, language))
+
+    return results
+
+
+def get_commit():
+    res = subprocess.run(
+        ['git', 'rev-parse', 'HEAD'],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    return res.stdout.strip() or None
+
+
+parser = argparse.ArgumentParser(description='Benchmark fibro on synthetic fixtures.')
+parser.add_argument(
+    '--sizes',
+    nargs='+',
+    type=int,
+    default=[1_000, 100_000, 1_000_000],
+    help='numbers of entries in the flat directories',
+)
+parser.add_argument('--depth', type=int, default=8, help='depth of the deep tree')
+parser.add_argument('--repo-size', type=int, default=10_000, help='files in the git repo')
+parser.add_argument('--lines', type=int, default=100_000, help='lines per source file')
+parser.add_argument('--output', type=Path, help='write the results here instead of stdout')
+parser.add_argument('--keep', action='store_true', help='keep the generated fixtures')
+
+
+def main():
+    args = parser.parse_args()
+
+    fixtures = Path(tempfile.mkdtemp(prefix='fibro-bench-'))
+    try:
+        create_config(fixtures)
+        sys.path.insert(0, str(ROOT))
+        results = asyncio.run(run(fixtures, args))
+    finally:
+        if args.keep:
+            print(f'fixtures kept in {fixtures}', file=sys.stderr)
+        else:
+            shutil.rmtree(fixtures, ignore_errors=True)
+
+    output = json.dumps({
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'results': results,
+    }, indent=2)
+
+    if args.output:
+        args.output.write_text(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,47 @@
 import argparse
+import os
+import sys
+import time
 
-from .app import App
+START = time.perf_counter()
+
+from . import trace  # noqa: E402
+from .app import App  # noqa: E402
+
+IMPORTED = time.perf_counter()
 
 
 parser = argparse.ArgumentParser()
 parser.add_argument('path', nargs='?', default='.')
+parser.add_argument(
+    '--startup-time',
+    action='store_true',
+    help='report how long starting up took on exit',
+)
+parser.add_argument(
+    '--trace',
+    metavar='PATH',
+    default=os.environ.get('FIBRO_TRACE'),
+    help='write a chrome trace of where time is spent to PATH on exit, and '
+    'print a summary, defaults to $FIBRO_TRACE',
+)
 
 
 def main():
     args = parser.parse_args()
+    if args.trace:
+        trace.start()
+
     app = App(args.path)
     app.run()
 
+    if args.trace:
+        trace.finish(args.trace)
+
+    if args.startup_time:
+        for name, moment in [('imported', IMPORTED), *app.startup_times.items()]:
+            print(f'{name}: {(moment - START) * 1000:.1f}ms', file=sys.stderr)
+
 
 if __name__ == '__main__':
     main()
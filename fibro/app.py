@@ -1,12 +1,18 @@
 import asyncio
+import time
+from collections import deque
 from pathlib import Path
 
+from textual import events, work
 from textual.app import App as BaseApp
-from textual.containers import Horizontal, Vertical, VerticalScroll
+from textual.containers import Horizontal, Vertical
 from textual.binding import Binding
 from textual.reactive import var
+from textual.worker import get_current_worker
 
+from . import trace
 from .config import HELIX_THEME
+from .jobs import RECLAIMER
 from .browser import Browser
 from .preview import Preview
 from .prompt import Prompt
@@ -14,6 +20,10 @@ from .simple_input import SimpleInput
 from .utils import show_path, forward_bindings, ForwardMixin
 
 
+# How often the progress of a running job is shown
+JOB_INTERVAL = 0.2
+
+
 class App(ForwardMixin, BaseApp):
 
     show_hidden = var(False)
@@ -22,6 +32,7 @@ class App(ForwardMixin, BaseApp):
     BINDINGS = [
         Binding('escape', 'quit'),
         Binding('alt+h', 'toggle_hidden'),
+        Binding('alt+x', 'cancel_job'),
         *forward_bindings(SimpleInput, '#search'),
         *forward_bindings(Browser),
     ]
@@ -29,6 +40,14 @@ class App(ForwardMixin, BaseApp):
     def __init__(self, path='.'):
         super().__init__()
 
+        # Moments during startup, for reporting how long it took
+        self.startup_times = {}
+
+        # Move, copy and delete jobs waiting to run, they run one at a time
+        self.jobs = deque()
+        self.job = None
+        self.job_timer = None
+
         path = Path(path).resolve()
 
         if path.is_dir():
@@ -42,9 +61,8 @@ class App(ForwardMixin, BaseApp):
         with Horizontal():
             with Vertical(classes='pane'):
                 yield SimpleInput(id='search')
-                with VerticalScroll():
-                    yield Browser(self.init_path, self.init_selected)
-            with VerticalScroll(classes='pane'):
+                yield Browser(self.init_path, self.init_selected)
+            with Vertical(classes='pane'):
                 yield Preview()
 
     def on_mount(self):
@@ -54,6 +72,101 @@ class App(ForwardMixin, BaseApp):
         browser = self.query_one(Browser)
         self.set_title(browser.path)
         self.watch(browser, 'path', self.set_title)
+        self.watch(browser, 'recursive', self.set_recursive)
+
+        self.call_after_refresh(self.mark_startup, 'first paint')
+        RECLAIMER.report = self.report_reclaim
+        self.call_after_refresh(self.resume_reclaim)
+
+    def on_unmount(self):
+        RECLAIMER.report = None
+        self.jobs.clear()
+        if self.job is not None:
+            self.job.cancel()
+
+    def mark_startup(self, name):
+        self.startup_times.setdefault(name, time.perf_counter())
+
+    @work(thread=True)
+    def resume_reclaim(self):
+        # Finish deletes that were interrupted by exiting
+        RECLAIMER.resume()
+
+    def report_reclaim(self, path, error):
+        # Called from the reclaim threads, which outlive the app
+        try:
+            self.call_from_thread(
+                self.notify,
+                f'{error}, what is left is in {path} and is tried again on the next start',
+                title='delete failed',
+                severity='error',
+            )
+        except RuntimeError:
+            pass
+
+    def add_job(self, job):
+        self.jobs.append(job)
+        if self.job is None:
+            self.start_job()
+        else:
+            self.show_job()
+
+    def is_busy(self, path):
+        # Whether a running or queued job uses the path or a path around it
+        jobs = self.jobs if self.job is None else [self.job, *self.jobs]
+        return any(
+            path == job_path or path in job_path.parents or job_path in path.parents
+            for job in jobs
+            for job_path in job.paths
+        )
+
+    def start_job(self):
+        if self.jobs:
+            self.job = self.jobs.popleft()
+            self.run_job(self.job)
+            if self.job_timer is None:
+                self.job_timer = self.set_interval(JOB_INTERVAL, self.show_job)
+        else:
+            self.job = None
+            if self.job_timer is not None:
+                self.job_timer.stop()
+                self.job_timer = None
+        self.show_job()
+
+    @work(thread=True, group='jobs')
+    def run_job(self, job):
+        with trace.span('job', kind=job.kind):
+            job.run()
+        if not get_current_worker().is_cancelled:
+            self.call_from_thread(self.finish_job, job)
+
+    def finish_job(self, job):
+        if job.error is not None:
+            self.notify(str(job.error), title=f'{job.kind} failed', severity='error')
+        self.query_one(Browser).queue_paths(job.paths)
+        self.start_job()
+
+    def show_job(self):
+        if self.job is None:
+            subtitle = None
+        else:
+            subtitle = self.job.describe()
+            if self.jobs:
+                subtitle += f', {len(self.jobs)} queued'
+        self.query_one(Browser).parent.border_subtitle = subtitle
+
+    def action_cancel_job(self):
+        if self.job is not None:
+            self.job.cancel()
+
+    async def on_event(self, event):
+        # Keys reach the app twice, the second time they come back from the
+        # screen they were forwarded to is when they are handled
+        if isinstance(event, events.Key) and event.is_forwarded:
+            with trace.span('key', key=event.key):
+                await super().on_event(event)
+        else:
+            await super().on_event(event)
 
     def action_toggle_hidden(self):
         self.show_hidden = not self.show_hidden
@@ -71,6 +184,9 @@ class App(ForwardMixin, BaseApp):
     def set_title(self, path):
         self.console.set_window_title(f'fb: {show_path(path)}')
 
+    def set_recursive(self, recursive):
+        self.query_one(Browser).parent.border_title = 'find' if recursive else None
+
     async def prompt(self, label, *, default=''):
         fut = asyncio.get_running_loop().create_future()
         self.push_screen(Prompt(label, default), fut.set_result)
@@ -1,25 +1,40 @@
 import os
 import subprocess
-import shutil
 
-from textual.reactive import var, reactive
-from textual.fuzzy import Matcher
+from textual.geometry import Region
+from textual.reactive import var
 from textual.binding import Binding
 
 from rich.text import Text
 
-from . import config
-from .directory import Directory
+from . import config, git, trace
+from .fuzzy import Scorer, Ranking, highlight
+from .directory import Directory, iter_chunks
+from .find import find
+from .jobs import RECLAIMER, Job, stage
 
 
 MATCH_STYLE = config.get_style('special')
 
 
+def is_subsequence(sub, value):
+    chars = iter(value.lower())
+    return all(char in chars for char in sub.lower())
+
+
+def entry_key(value):
+    # Matches the order of Directory.entries
+    return (value != '..', not value.endswith('/'), value)
+
+
 class Browser(Directory):
 
-    matcher = None
+    scorer = None
     selected = var(0)
     selected_value = var(None)
+    recursive = var(False)
+
+    COMPONENT_CLASSES = {'browser--selected'}
 
     BINDINGS = [
         Binding('up', 'up'),
@@ -38,6 +53,8 @@ class Browser(Directory):
 
         Binding('alt+p', 'go_prev'),
         Binding('alt+n', 'go_next'),
+
+        Binding('alt+f', 'toggle_recursive'),
     ]
 
     def __init__(self, path='.', autoselect=None):
@@ -45,6 +62,8 @@ class Browser(Directory):
         self.prev_stack = []
         self.next_stack = []
         self.marked = set()
+        self.scores = {}
+        self.reset_selected = True
         super().__init__(path)
 
     def on_mount(self):
@@ -53,40 +72,127 @@ class Browser(Directory):
 
     def set_filter(self, filter):
         if filter:
-            self.matcher = Matcher(filter, match_style=MATCH_STYLE)
+            self.scorer = Scorer(filter)
         else:
-            self.matcher = None
+            self.scorer = None
 
-        self.set_values()
-        self.refresh(recompose=True)
+        self.reset_selected = True
+        with trace.span('filter', query=filter):
+            self.update_values()
 
     def set_values(self):
+        self.reset_selected = True
+        self.scores.clear()
         super().set_values()
 
-        if self.matcher:
-            self.values = sorted(
-                filter(self.matcher.match, self.values),
-                key=self.matcher.match,
-                reverse=True,
-            )
+    def scan_values(self, path, show_hidden):
+        if not self.recursive:
+            yield from super().scan_values(path, show_hidden)
+            return
+
+        values = find(path, bool(git.get_root(path)), show_hidden)
+        for chunk in iter_chunks(values):
+            dirs = []
+            files = []
+            for value in chunk:
+                if value.endswith('/'):
+                    dirs.append(value)
+                else:
+                    files.append(value)
+            yield dirs, files, set()
+
+    @property
+    def cache_listing(self):
+        # Recursive listings change with everything below the path
+        return not self.recursive
+
+    def get_git_status(self, path, ignored):
+        if self.recursive:
+            return {}
+        return super().get_git_status(path, ignored)
 
-        if self.autoselect:
+    def get_scores(self, query):
+        try:
+            return self.scores[query]
+        except KeyError:
+            pass
+
+        # Every value matching a query also matches any subsequence of that
+        # query, so we only have to rescore the survivors of the longest one
+        # we already know about
+        queries = [
+            cached_query
+            for cached_query in self.scores
+            if is_subsequence(cached_query, query)
+        ]
+        if queries:
+            candidates = self.scores[max(queries, key=len)]
+        else:
+            candidates = self.entries
+
+        scores = Scorer(query).score(candidates)
+
+        # Only keep the results we can narrow down from or return to with
+        # backspace
+        self.scores = {cached_query: self.scores[cached_query] for cached_query in queries}
+        self.scores[query] = scores
+        return scores
+
+    def update_values(self):
+        selected_value = self.selected_value
+
+        if self.scorer:
+            scores = self.get_scores(self.scorer.query)
+            values = Ranking(scores, lambda value: (-scores[value][0], entry_key(value)))
+        else:
+            values = self.entries
+
+        self.values = values
+
+        if self.autoselect and self.autoselect in values:
             self.action_select_value(self.autoselect)
             self.autoselect = None
-        else:
+        elif self.reset_selected or selected_value not in values:
             self.selected = 0
+        else:
+            self.action_select_value(selected_value)
+        self.reset_selected = False
 
         self.watch_selected(self.selected)
 
+    def add_values(self, dirs, files):
+        for query, scores in self.scores.items():
+            scores.update(Scorer(query).score([*dirs, *files]))
+        super().add_values(dirs, files)
+
+    def insert_value(self, value):
+        for query, scores in self.scores.items():
+            scores.update(Scorer(query).score([value]))
+        super().insert_value(value)
+
+    def discard_value(self, value):
+        for scores in self.scores.values():
+            scores.pop(value, None)
+        super().discard_value(value)
+
+    def finish_values(self, worker, ignored, git_status):
+        if not worker.is_cancelled:
+            self.autoselect = None
+        super().finish_values(worker, ignored, git_status)
+
     def watch_selected(self, selected):
         if self.values:
             self.selected_value = self.values[selected]
+            self.scroll_to_region(Region(0, selected, 1, 1), animate=False)
         else:
             self.selected_value = None
+        self.refresh()
 
     def render_value(self, value):
-        if self.matcher:
-            return self.matcher.highlight(value)
+        if self.scorer:
+            scores = self.get_scores(self.scorer.query)
+            _, offsets = scores.get(value, (0, ()))
+            return highlight(value, offsets, MATCH_STYLE)
         else:
             return Text(value)
 
@@ -157,11 +263,29 @@ class Browser(Directory):
         else:
             return set()
 
+    def action_toggle_recursive(self):
+        self.recursive = not self.recursive
+        self.set_values()
+
     def action_select(self):
         if not (path := self.selected_path):
             return
 
-        if path.is_dir():
+        if self.recursive and self.selected_value != '..':
+            # Jump to the directory containing the result with the result
+            # selected
+            self.recursive = False
+            self.autoselect = path.name
+            if self.selected_value.endswith('/'):
+                self.autoselect += '/'
+
+            if path.parent == self.path:
+                self.set_values()
+            else:
+                self.action_push(path.parent)
+            self.screen.query_one('#search').action_clear()
+
+        elif path.is_dir():
             self.action_push(path)
             self.screen.query_one('#search').action_clear()
 
@@ -175,8 +299,12 @@ class Browser(Directory):
             with self.app.suspend():
                 subprocess.run([editor, str(path)])
 
+            if self.git_root:
+                git.invalidate(self.git_root)
+                self.set_git_status()
+
             self.app.refresh()
-            self.screen.query_one('Preview').refresh(recompose=True)
+            self.screen.query_one('Preview').reload()
 
     async def action_create(self):
         name = await self.app.prompt('create file or directory')
@@ -196,7 +324,6 @@ class Browser(Directory):
             self.autoselect = path.name
             if self.path == path.parent:
                 self.set_values()
-                self.refresh(recompose=True)
             else:
                 self.action_push(path.parent)
 
@@ -210,21 +337,24 @@ class Browser(Directory):
             return
 
         name = name.rstrip('/')
-        is_dir = path.is_dir()
+        is_dir = self.selected_value.endswith('/')
 
         path.rename(path.parent / name)
 
+        # In recursive mode values are paths relative to the current path
+        prefix, _, _ = self.selected_value.rstrip('/').rpartition('/')
+        if prefix:
+            name = f'{prefix}/{name}'
         if is_dir:
             name += '/'
 
+        self.discard_value(self.selected_value)
+        self.insert_value(name)
+
         self.values[self.selected] = name
         self.set_reactive(Browser.selected_value, name)
         self.set_git_status()
-
-        child = self.children[self.selected]
-        child.value = name
-        child.text = self.render_value(name)
-        child.refresh()
+        self.mutate_reactive(Browser.values)
 
     async def action_move(self, copy=False):
         if not (paths := self.selected_paths):
@@ -234,35 +364,34 @@ class Browser(Directory):
             # TODO show why
             return
 
+        operations = []
+        # Destinations of earlier paths do not exist until the job runs
+        planned = set()
         for path in paths:
             dest = self.path / path.name
             if dest == path and not copy:
                 continue
 
-            while dest.exists():
+            while dest.exists() or dest in planned:
                 new_name = await self.app.prompt(f'{dest.name} already exists, provide new name')
-                if new_name is None:
+                if new_name is None or (new_name == dest.name and dest == path):
+                    dest = None
                     break
                 elif new_name == dest.name:
-                    if dest == path:
-                        break
-                    elif dest.is_dir():
-                        shutil.rmtree(dest)
-                    else:
-                        dest.unlink()
+                    operations.append(('delete', dest, None))
+                    break
                 else:
                     dest = dest.parent / new_name
-            else:
-                if not copy:
-                    path.rename(dest)
-                elif path.is_dir():
-                    shutil.copytree(path, dest)
-                else:
-                    shutil.copy(path, dest)
+
+            if dest is not None:
+                planned.add(dest)
+                operations.append(('copy' if copy else 'move', path, dest))
+
+        if operations:
+            self.app.add_job(Job('copy' if copy else 'move', operations))
 
         self.marked.clear()
-        self.set_values()
-        self.refresh(recompose=True)
+        self.refresh()
 
     def action_delete(self):
         if not (paths := self.selected_paths):
@@ -272,12 +401,17 @@ class Browser(Directory):
             # TODO show why
             return
 
+        operations = []
         for path in paths:
-            if path.parent == self.path:
-                value = path.name
-                if path.is_dir():
+            if path.is_relative_to(self.path):
+                value = path.relative_to(self.path).as_posix()
+                if f'{value}/' in self.values:
                     value += '/'
+            else:
+                value = None
 
+            if value in self.values:
+                self.discard_value(value)
                 index = self.values.index(value)
                 self.values.pop(index)
 
@@ -292,14 +426,19 @@ class Browser(Directory):
                 else:
                     self.selected_value = self.values[self.selected]
 
-            if path.is_dir():
-                shutil.rmtree(path)
+            # Staging is only a rename, so it need not wait behind copies,
+            # unless those copies use the path
+            if not self.app.is_busy(path) and (staged := stage(path)) is not None:
+                RECLAIMER.reclaim(staged)
             else:
-                path.unlink()
+                operations.append(('delete', path, None))
+
+        if operations:
+            self.app.add_job(Job('delete', operations))
 
         self.set_git_status()
         self.marked.clear()
-        self.refresh(recompose=True)
+        self.mutate_reactive(Browser.values)
 
     def action_mark(self):
         if self.selected_value in (None, '..'):
@@ -311,7 +450,7 @@ class Browser(Directory):
         except KeyError:
             self.marked.add(path)
 
-        self.children[self.selected].refresh()
+        self.refresh()
 
     def action_mark_all(self):
         paths = {
@@ -325,36 +464,20 @@ class Browser(Directory):
         else:
             self.marked.difference_update(paths)
 
-        for child in self.children:
-            child.refresh()
+        self.refresh()
 
-    class Child(Directory.Child):
+    def get_row_style(self, index):
+        style = super().get_row_style(index)
+        if index == self.selected:
+            style += self.get_component_rich_style('browser--selected')
+        return style
 
-        selected = reactive(False)
+    def render_row(self, index):
+        text = Text('> ' if index == self.selected else '  ')
+        text.append_text(super().render_row(index))
+        return text
 
-        def on_mount(self):
-            self.watch(self.parent, 'selected_value', self.check_selected)
-
-        def check_selected(self, selected_value):
-            self.selected = selected_value == self.value
-
-        def watch_selected(self, selected):
-            if selected:
-                self.add_class('selected')
-            else:
-                self.remove_class('selected')
-
-        @property
-        def marked(self):
-            path = self.parent.path / self.value
-            return path in self.parent.marked
-
-        def render(self):
-            text = Text('> ' if self.selected else '  ')
-            text.append_text(super().render())
-            return text
-
-        def render_name(self, text):
-            if self.marked:
-                text.append_text(Text('* ', style=MATCH_STYLE))
-            super().render_name(text)
+    def render_name(self, text, index):
+        if self.marked and self.path / self.values[index] in self.marked:
+            text.append_text(Text('* ', style=MATCH_STYLE))
+        super().render_name(text, index)
@@ -0,0 +1,64 @@
+import threading
+from collections import OrderedDict
+
+
+# Filesystem timestamps can lag behind the clock a little, so anything
+# modified shortly before it was read can not be trusted by its mtime
+MTIME_SLACK = 10_000_000
+
+
+def get_stat_signature(path):
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class SizedCache:
+    # Recently used values together with what they are valid for, evicted
+    # least recently used first to stay within a budget in bytes
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.values = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, signature):
+        with self.lock:
+            try:
+                cached_signature, value, _ = self.values[key]
+            except KeyError:
+                return None
+            if cached_signature != signature:
+                return None
+            self.values.move_to_end(key)
+            return value
+
+    def get_outdated(self, key):
+        # Whatever value we had for the key, even if it is no longer valid
+        with self.lock:
+            try:
+                _, value, _ = self.values[key]
+            except KeyError:
+                return None
+            return value
+
+    def set(self, key, signature, value, size):
+        with self.lock:
+            try:
+                _, _, old_size = self.values.pop(key)
+            except KeyError:
+                pass
+            else:
+                self.size -= old_size
+
+            if size > self.max_size:
+                return
+            self.values[key] = signature, value, size
+            self.size += size
+
+            while self.size > self.max_size:
+                _, (_, _, evicted_size) = self.values.popitem(last=False)
+                self.size -= evicted_size
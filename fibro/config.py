@@ -3,23 +3,35 @@ from textual.theme import Theme
 from rich.text import Text
 from rich.style import Style
 
+import os
+import pickle
 import tomllib
+from functools import cache
 from os import environ
 from pathlib import Path
 
 
 XDG_CONFIG_HOME = Path(environ.get('XDG_CONFIG_HOME', '~/.config')).expanduser().resolve()
+XDG_CACHE_HOME = Path(environ.get('XDG_CACHE_HOME', '~/.cache')).expanduser().resolve()
 
+CONFIG_PATH = XDG_CONFIG_HOME / 'helix/config.toml'
+# Settings that have no place in the helix config live in a config of our
+# own, this one is optional
+OPTIONS_PATH = XDG_CONFIG_HOME / 'fibro/config.toml'
 
-with XDG_CONFIG_HOME.joinpath('helix/config.toml').open('rb') as f:
-    CONFIG = tomllib.load(f)
+# The parsed configs and resolved theme are cached together with the mtimes
+# of all files they came from
+CACHE_PATH = XDG_CACHE_HOME / 'fibro/config.pickle'
+CACHE_VERSION = 1
+
+
+HELIX = Path(__file__).parent / 'helix'
 
 
 NO_DEFAULT = object()
 
 
-def get(*keys, default=NO_DEFAULT):
-    value = CONFIG
+def lookup(value, keys, default):
     for key in keys:
         try:
             value = value[key]
@@ -28,13 +40,24 @@ def get(*keys, default=NO_DEFAULT):
                 raise
             else:
                 return default
-    return value            
+    return value
 
 
-HELIX = Path(__file__).parent / 'helix'
+def get_mtime(path):
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
 
 
-def load_theme(theme):
+def load_toml(path, mtimes):
+    # Take the mtime first so a change while reading invalidates the cache
+    mtimes.append((path, get_mtime(path)))
+    with path.open('rb') as f:
+        return tomllib.load(f)
+
+
+def load_theme(theme, mtimes):
     match theme:
         case 'default':
             path = HELIX / 'theme.toml'
@@ -43,24 +66,18 @@ def load_theme(theme):
         case _:
             path = HELIX / f'runtime/themes/{theme}.toml'
 
-    with path.open('rb') as f:
-        data = tomllib.load(f)
+    data = load_toml(path, mtimes)
 
     try:
         base_theme = data.pop('inherits')
     except KeyError:
         return data
 
-    base_data = load_theme(base_theme)
+    base_data = load_theme(base_theme, mtimes)
     base_data.update(data)
     return base_data
 
 
-THEME = get('theme', default='default')
-THEME_STYLES = load_theme(THEME)
-
-
-palette = THEME_STYLES.pop('palette')
 modifier_translations = {
     'bold': 'bold',
     'italic': 'italic',
@@ -69,27 +86,88 @@ modifier_translations = {
 }
 
 
-for key, value in THEME_STYLES.items():
-    if isinstance(value, str):
-        value = {'fg': value}
+def load_config():
+    mtimes = []
 
-    kwargs = {}
+    config = load_toml(CONFIG_PATH, mtimes)
 
-    if fg := value.get('fg'):
-        kwargs['color'] = palette.get(fg, fg)
+    try:
+        options = load_toml(OPTIONS_PATH, mtimes)
+    except FileNotFoundError:
+        options = {}
 
-    if bg := value.get('bg'):
-        kwargs['bgcolor'] = palette.get(bg, bg)
+    theme_styles = load_theme(lookup(config, ['theme'], 'default'), mtimes)
+    palette = theme_styles.pop('palette')
 
-    for modifier in value.get('modifiers', []):
-        try:
-            modifier = modifier_translations[modifier]
-        except KeyError:
-            pass
-        else:
-            kwargs[modifier] = True
+    for key, value in theme_styles.items():
+        if isinstance(value, str):
+            value = {'fg': value}
+
+        kwargs = {}
+
+        if fg := value.get('fg'):
+            kwargs['color'] = palette.get(fg, fg)
+
+        if bg := value.get('bg'):
+            kwargs['bgcolor'] = palette.get(bg, bg)
+
+        for modifier in value.get('modifiers', []):
+            try:
+                modifier = modifier_translations[modifier]
+            except KeyError:
+                pass
+            else:
+                kwargs[modifier] = True
 
-    THEME_STYLES[key] = Style(**kwargs)
+        theme_styles[key] = Style(**kwargs)
+
+    return mtimes, (config, options, theme_styles)
+
+
+def load_cached_config():
+    try:
+        with CACHE_PATH.open('rb') as f:
+            version, mtimes, data = pickle.load(f)
+    except Exception:
+        # Besides a missing or broken file, unpickling a cache written with
+        # other versions of rich or textual can fail in many ways
+        return None
+
+    if version != CACHE_VERSION:
+        return None
+    for path, mtime in mtimes:
+        if get_mtime(path) != mtime:
+            return None
+    return data
+
+
+def save_cached_config(mtimes, data):
+    tmp_path = CACHE_PATH.with_name(f'{CACHE_PATH.name}.{os.getpid()}')
+    try:
+        CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with tmp_path.open('wb') as f:
+            pickle.dump((CACHE_VERSION, mtimes, data), f)
+        tmp_path.replace(CACHE_PATH)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+
+
+if (data := load_cached_config()) is None:
+    mtimes, data = load_config()
+    save_cached_config(mtimes, data)
+
+CONFIG, OPTIONS, THEME_STYLES = data
+
+
+def get(*keys, default=NO_DEFAULT):
+    return lookup(CONFIG, keys, default)
+
+
+def get_option(*keys, default=NO_DEFAULT):
+    return lookup(OPTIONS, keys, default)
+
+
+THEME = get('theme', default='default')
 
 
 def get_style(keys):
@@ -97,15 +175,24 @@ def get_style(keys):
         keys = [keys]
 
     for key in keys:
-        for subkey in all_keys(key):
-            try:
-                return THEME_STYLES[subkey]
-            except KeyError:
-                pass
+        if (style := get_key_style(key)) is not None:
+            return style
 
     return Style()
 
 
+# The theme does not change while running, so every key only has to be
+# resolved once
+@cache
+def get_key_style(key):
+    for subkey in all_keys(key):
+        try:
+            return THEME_STYLES[subkey]
+        except KeyError:
+            pass
+    return None
+
+
 def all_keys(key):
     yield key
     key_len = len(key)
@@ -0,0 +1,158 @@
+from bisect import bisect_left
+from collections import Counter
+
+
+# Diffs with more edits than this are split at lines that occur once on both
+# sides, and hunks between those that still have more are treated as if they
+# were replaced as a whole
+MAX_EDITS = 1000
+
+
+def get_line_status(old_lines, new_lines):
+    # Compare numbers instead of strings
+    ids = {}
+    old = [ids.setdefault(line, len(ids)) for line in old_lines]
+    new = [ids.setdefault(line, len(ids)) for line in new_lines]
+
+    status = [None for _ in new]
+
+    # Most changes leave the start and the end of a file alone
+    start = 0
+    while start < len(old) and start < len(new) and old[start] == new[start]:
+        start += 1
+    old_end = len(old)
+    new_end = len(new)
+    while old_end > start and new_end > start and old[old_end - 1] == new[new_end - 1]:
+        old_end -= 1
+        new_end -= 1
+
+    matches = get_matches(old[start:old_end], new[start:new_end])
+    if matches is None:
+        matches = get_anchored_matches(old[start:old_end], new[start:new_end])
+
+    # Walk over the hunks between matching lines, added lines are considered
+    # changed for as long as there are deleted lines to pair them with
+    prev_x = -1
+    prev_y = -1
+    for x, y in [*matches, (old_end - start, new_end - start)]:
+        deleted = x - prev_x - 1
+        for index in range(prev_y + 1, y):
+            status[start + index] = 'changed' if index - prev_y <= deleted else 'added'
+        prev_x = x
+        prev_y = y
+
+    return status
+
+
+def get_anchored_matches(a, b):
+    # Match the lines that occur once on both sides in the order they are in,
+    # and then diff the hunks between them on their own
+    a_counts = Counter(a)
+    b_counts = Counter(b)
+    b_indexes = {
+        line: y
+        for y, line in enumerate(b)
+        if b_counts[line] == 1 and a_counts[line] == 1
+    }
+    anchors = get_increasing([
+        (x, b_indexes[line])
+        for x, line in enumerate(a)
+        if line in b_indexes
+    ])
+
+    matches = []
+    prev_x = -1
+    prev_y = -1
+    for x, y in [*anchors, (len(a), len(b))]:
+        gap = get_matches(a[prev_x + 1:x], b[prev_y + 1:y]) or []
+        matches.extend((prev_x + 1 + gap_x, prev_y + 1 + gap_y) for gap_x, gap_y in gap)
+        if x < len(a):
+            matches.append((x, y))
+        prev_x = x
+        prev_y = y
+    return matches
+
+
+def get_increasing(pairs):
+    # The longest subsequence of pairs that is increasing in its second item
+    # as well, pairs are sorted by their first item
+    tails = []
+    tail_indexes = []
+    prev_indexes = []
+    for index, (_, y) in enumerate(pairs):
+        i = bisect_left(tails, y)
+        if i == len(tails):
+            tails.append(y)
+            tail_indexes.append(index)
+        else:
+            tails[i] = y
+            tail_indexes[i] = index
+        prev_indexes.append(tail_indexes[i - 1] if i else None)
+
+    result = []
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        result.append(pairs[index])
+        index = prev_indexes[index]
+    result.reverse()
+    return result
+
+
+def get_matches(a, b):
+    # Myers' algorithm, returns the pairs of indexes of matching lines
+    n = len(a)
+    m = len(b)
+    max_d = min(n + m, MAX_EDITS)
+    offset = max_d + 1
+
+    v = [0] * (2 * max_d + 3)
+    trace = []
+
+    for d in range(max_d + 1):
+        # Keep the diagonals this step reads from for the way back
+        trace.append(v[offset - d - 1:offset + d + 2])
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+
+            if x >= n and y >= m:
+                return backtrack(trace, n, m)
+
+    return None
+
+
+def backtrack(trace, x, y):
+    matches = []
+
+    for d in range(len(trace) - 1, -1, -1):
+        if d == 0:
+            mid_x = 0
+        else:
+            # Diagonal k - 1 is at index k + d and k + 1 at index k + d + 2
+            v = trace[d]
+            k = x - y
+            down = k == -d or (k != d and v[k + d] < v[k + d + 2])
+            mid_x = v[k + d + 2] if down else v[k + d] + 1
+
+        while x > mid_x:
+            x -= 1
+            y -= 1
+            matches.append((x, y))
+
+        # Undo the insertion or deletion this step started with
+        if d != 0:
+            if down:
+                y -= 1
+            else:
+                x -= 1
+
+    matches.reverse()
+    return matches
@@ -1,150 +1,454 @@
+import os
+import stat
 import subprocess
+import sys
+import time
+from bisect import insort
 from pathlib import Path
 
-from textual.widget import Widget
-from textual.widgets import Static
+from textual import work
+from textual.geometry import Size
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
 from textual.reactive import var
+from textual.worker import get_current_worker
 
 from rich.text import Text
 
-from . import config
+from . import config, git, inotify, trace
+from .cache import MTIME_SLACK, SizedCache, get_stat_signature
+
+
+LIST_CHUNK_SIZE = 256
+LIST_CHUNK_INTERVAL = 0.05
+# Changes in a directory are collected for this long before they are applied
+CHANGES_DELAY = 0.1
+# Budget for keeping listings of recently seen directories around, measured
+# in bytes of the values in them
+LISTING_CACHE_SIZE = 32 * 1024 * 1024
+# The ignore file git reads unless core.excludesFile says otherwise
+GIT_EXCLUDES = config.XDG_CONFIG_HOME / 'git/ignore'
+
+
+def iter_chunks(items):
+    chunk = []
+    chunk_size = LIST_CHUNK_SIZE
+    listed = 0
+    flushed_at = time.monotonic()
+
+    for item in items:
+        chunk.append(item)
+
+        if (
+            len(chunk) >= chunk_size or
+            time.monotonic() - flushed_at >= LIST_CHUNK_INTERVAL
+        ):
+            yield chunk
+            listed += len(chunk)
+            # Grow chunks with the listing so merging them in stays linear
+            # in the size of the directory
+            chunk_size = max(chunk_size, listed)
+            chunk = []
+            flushed_at = time.monotonic()
+
+    if chunk:
+        yield chunk
+
+
+def get_value(dir_entry):
+    # Only uses what scandir already knows, so this does not stat unless the
+    # filesystem does not report types or the entry is a symlink
+    try:
+        is_dir = dir_entry.is_dir()
+    except OSError:
+        is_dir = False
+    return f'{dir_entry.name}/' if is_dir else dir_entry.name
+
+
+def get_path_value(path):
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+    is_dir = stat.S_ISDIR(st.st_mode) or (stat.S_ISLNK(st.st_mode) and os.path.isdir(path))
+    return f'{path.name}/' if is_dir else path.name
+
+
+def get_listing_signature(path):
+    # Besides the directory itself, which of its entries are ignored depends
+    # on every ignore file that applies to it and on what is tracked
+    paths = [path]
+    if (root := git.get_root(path)) is not None:
+        for parent in [path, *path.parents]:
+            paths.append(parent / '.gitignore')
+            if parent == root:
+                break
+        git_dir = git.get_snapshot(root).git_dir
+        paths += [git_dir / 'info/exclude', git_dir / 'index', GIT_EXCLUDES]
+    return root, tuple(map(get_stat_signature, paths))
+
+
+def is_settled(signature, listed_at):
+    _, stats = signature
+    return stats[0] is not None and all(
+        st is None or st[0] < listed_at - MTIME_SLACK for st in stats
+    )
+
+
+def get_listing_size(listing):
+    dirs, files, ignored = listing
+    return sum(
+        sys.getsizeof(values) + sum(map(sys.getsizeof, values))
+        for values in [dirs, files, ignored]
+    )
+
+
+LISTING_CACHE = SizedCache(LISTING_CACHE_SIZE)
 
 
-class Directory(Widget):
+class Directory(ScrollView, can_focus=False):
 
     path = var(None)
-    values = var([])
+    values = var([], always_update=True)
 
     def __init__(self, path='.'):
         super().__init__()
 
-        self._git_root = None
-        self._git_root_path = None
         self.git_status = {}
+        self.ignored = set()
+        self.dirs = []
+        self.files = []
+
+        self.listing = False
+        self.directory_watch = None
+        # Names that changed, or None if everything might have changed
+        self.changes = set()
+        self.changes_applying = set()
+        self.changes_timer = None
 
         self.set_reactive(Directory.path, Path(path).resolve())
-        self.set_values()
+        self.set_reactive(Directory.values, ['..'])
 
     def watch_path(self):
         self.set_values()
-        self.refresh(recompose=True)
 
     def on_mount(self):
         self.watch(self.app, 'show_hidden', self.watch_show_hidden, init=False)
+        self.set_values()
+
+    def on_unmount(self):
+        inotify.remove_watch(self.directory_watch)
+        self.directory_watch = None
 
     def watch_show_hidden(self, _):
         self.set_values()
-        self.refresh(recompose=True)
 
     @property
     def git_root(self):
-        if self._git_root_path != self.path:
-            root = self.path
-            while True:
-                if root.joinpath('.git').exists():
-                    break
-                if root.parent == root:
-                    root = None
-                    break
-                root = root.parent
-
-            self._git_root = root
-            self._git_root_path = self.path
+        if self.path is None:
+            return None
+        return git.get_root(self.path)
 
-        return self._git_root
+    @property
+    def entries(self):
+        return ['..', *self.dirs, *self.files]
 
     def set_values(self):
+        self.dirs = []
+        self.files = []
+        self.ignored = set()
+        self.git_status.clear()
+
+        self.changes = set()
+        self.changes_applying = set()
+        self.workers.cancel_group(self, 'apply_changes')
+        self.workers.cancel_group(self, 'update_git_status')
+        inotify.remove_watch(self.directory_watch)
+        self.directory_watch = None
+
         if self.path is None:
-            self.values = []
+            self.workers.cancel_group(self, 'list_values')
+            self.set_reactive(Directory.values, [])
+            self.update_values()
             return
 
-        paths = {
-            path
-            for path in self.path.iterdir()
-            if not path.name.startswith('.') or self.app.show_hidden
-        }
-
-        if paths and not self.app.show_hidden and self.git_root:
-            name_paths = {path.name: path for path in paths}
-            res = subprocess.run(
-                ['git', 'check-ignore', *name_paths],
-                cwd=self.path,
-                capture_output=True,
+        # Start watching before listing so we do not miss anything, changes
+        # are only applied once the listing is done
+        self.directory_watch = inotify.add_watch(self.path, self.queue_change)
+        self.listing = True
+
+        show_hidden = self.app.show_hidden
+        ignored = None
+        if self.cache_listing and (
+            listing := LISTING_CACHE.get(
+                (self.path, show_hidden), get_listing_signature(self.path),
             )
-            for line in res.stdout.decode().split('\n'):
-                if not line:
-                    continue
-                paths.remove(name_paths[line])
+        ) is not None:
+            dirs, files, ignored = listing
+            self.dirs = list(dirs)
+            self.files = list(files)
 
+        self.update_values()
+        self.list_values(self.path, show_hidden, self.cache_listing, ignored)
+
+    @property
+    def cache_listing(self):
+        return True
+
+    def update_values(self):
+        self.values = self.entries
+
+    def add_values(self, dirs, files):
+        if dirs:
+            self.dirs.extend(dirs)
+            self.dirs.sort()
+        if files:
+            self.files.extend(files)
+            self.files.sort()
+        self.update_values()
+
+    def insert_value(self, value):
+        values = self.dirs if value.endswith('/') else self.files
+        insort(values, value)
+
+    def discard_value(self, value):
+        values = self.dirs if value.endswith('/') else self.files
+        try:
+            values.remove(value)
+        except ValueError:
+            pass
+
+    @work(thread=True, exclusive=True, group='list_values')
+    def list_values(self, path, show_hidden, cache_listing, ignored=None):
+        # A cached listing only needs its git status to be brought up to date
+        worker = get_current_worker()
+
+        if ignored is None:
+            signature = get_listing_signature(path)
+            listed_at = time.time_ns()
+            all_dirs = []
+            all_files = []
+            ignored = set()
+
+            for dirs, files, chunk_ignored in self.scan_values(path, show_hidden):
+                if worker.is_cancelled:
+                    return
+                all_dirs.extend(dirs)
+                all_files.extend(files)
+                ignored.update(chunk_ignored)
+                self.app.call_from_thread(self.add_chunk, worker, dirs, files)
+
+            if worker.is_cancelled:
+                return
+            if cache_listing and is_settled(signature, listed_at):
+                all_dirs.sort()
+                all_files.sort()
+                listing = all_dirs, all_files, ignored
+                LISTING_CACHE.set(
+                    (path, show_hidden), signature, listing, get_listing_size(listing),
+                )
+
+        git_status = self.get_git_status(path, ignored)
+        if not worker.is_cancelled:
+            self.app.call_from_thread(self.finish_values, worker, ignored, git_status)
+
+    def scan_values(self, path, show_hidden):
+        try:
+            it = os.scandir(path)
+        except OSError:
+            return
+
+        with it:
+            values = (
+                get_value(entry)
+                for entry in it
+                if not entry.name.startswith('.') or show_hidden
+            )
+            for chunk in iter_chunks(values):
+                yield self.filter_chunk(path, chunk, show_hidden)
+
+    def filter_chunk(self, path, values, show_hidden):
+        ignored = set()
+
+        if values and git.get_root(path):
+            with trace.span('git check-ignore', path=path, entries=len(values)):
+                res = subprocess.run(
+                    ['git', 'check-ignore', '-z', '--stdin'],
+                    cwd=path,
+                    input=b'\0'.join(os.fsencode(value.rstrip('/')) for value in values),
+                    capture_output=True,
+                )
+            ignored.update(os.fsdecode(res.stdout).split('\0'))
+            ignored.discard('')
+            if not show_hidden:
+                values = [value for value in values if value.rstrip('/') not in ignored]
 
         dirs = []
         files = []
-        for path in paths:
-            if path.is_dir():
-                dirs.append(f'{path.name}/')
+        for value in values:
+            if value.endswith('/'):
+                dirs.append(value)
             else:
-                files.append(path.name)
+                files.append(value)
+        return dirs, files, ignored
 
-        dirs.sort()
-        files.sort()
-        self.values = ['..', *dirs, *files]
-        self.set_git_status()
+    def add_chunk(self, worker, dirs, files):
+        if not worker.is_cancelled:
+            self.add_values(dirs, files)
 
-    def set_git_status(self):
-        self.git_status.clear()
+    def finish_values(self, worker, ignored, git_status):
+        if not worker.is_cancelled:
+            self.ignored = ignored
+            self.set_git_status_result(git_status)
+            self.listing = False
+            self.refresh()
 
-        if not self.git_root:
+            if self.changes != set():
+                self.flush_changes()
+
+    def queue_change(self, mask, name):
+        if name in (None, '.git'):
+            git.forget_roots(self.path)
+
+        if name is None or mask & (inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF):
+            self.changes = None
+        elif self.changes is not None:
+            self.changes.add(name)
+
+        if self.changes_timer is None:
+            self.changes_timer = self.set_timer(CHANGES_DELAY, self.flush_changes)
+
+    def queue_paths(self, paths):
+        for path in paths:
+            if path.parent == self.path:
+                self.queue_change(0, path.name)
+
+    def flush_changes(self):
+        self.changes_timer = None
+
+        if self.changes is None:
+            self.set_values()
+            return
+        if self.listing or not self.changes:
             return
 
-        res = subprocess.run(
-            ['git', 'ls-files', '-t', '--modified', '--others', '--exclude-standard', '--directory'],
-            cwd=self.path,
-            capture_output=True,
+        # Changes still being applied are applied again together with the
+        # new ones, so an older result can never overwrite a newer one
+        self.changes_applying.update(self.changes)
+        self.changes = set()
+        self.apply_changes(
+            self.path,
+            set(self.changes_applying),
+            self.ignored - self.changes_applying,
+            self.app.show_hidden,
         )
-        for line in res.stdout.decode().split('\n'):
-            if not line:
-                continue
-            type, name = line.split(' ', 1)
-
-            parts = name.rstrip('/').split('/')
-            if parts == ['.']:
-                for value in self.values:
-                    self.git_status[value] = 'added'
-                break
 
-            path = self.path / parts[0]
-            name = path.name
-            if path.is_dir():
-                name += '/'
+    @work(thread=True, exclusive=True, group='apply_changes')
+    def apply_changes(self, path, names, ignored, show_hidden):
+        worker = get_current_worker()
 
-            if type == '?' and len(parts) == 1:
-                self.git_status[name] = 'added'
-            else:
-                self.git_status[name] = 'changed'
+        children = [
+            value
+            for name in names
+            if (not name.startswith('.') or show_hidden)
+            and (value := get_path_value(path / name)) is not None
+        ]
+        dirs, files, changed_ignored = self.filter_chunk(path, children, show_hidden)
+        ignored = ignored | changed_ignored
 
-    def compose(self):
-        for value in self.values:
-            yield self.Child(value, self.render_value(value))
-        if not self.values:
-            yield Static('')
+        if worker.is_cancelled:
+            return
 
-    def render_value(self, value):
-        return Text(value)
+        git_status = self.get_git_status(path, ignored)
+        if not worker.is_cancelled:
+            self.app.call_from_thread(
+                self.finish_changes, worker, names, dirs, files, ignored, git_status,
+            )
+
+    def finish_changes(self, worker, names, dirs, files, ignored, git_status):
+        if worker.is_cancelled:
+            return
+
+        self.changes_applying.difference_update(names)
+        for name in names:
+            self.discard_value(name)
+            self.discard_value(f'{name}/')
+        for value in [*dirs, *files]:
+            self.insert_value(value)
+
+        self.ignored = ignored
+        self.set_git_status_result(git_status)
+        self.update_values()
+
+    def set_git_status(self):
+        # Git status can take a while in a large repository, so only the
+        # status we already have is shown until it is done
+        if self.path is None:
+            self.git_status = {}
+        else:
+            self.update_git_status(self.path, self.ignored)
+
+    @work(thread=True, exclusive=True, group='update_git_status')
+    def update_git_status(self, path, ignored):
+        worker = get_current_worker()
+        git_status = self.get_git_status(path, ignored)
+        if not worker.is_cancelled:
+            self.app.call_from_thread(self.finish_git_status, worker, git_status)
+
+    def finish_git_status(self, worker, git_status):
+        if not worker.is_cancelled:
+            self.set_git_status_result(git_status)
+            self.refresh()
+
+    def get_git_status(self, path, ignored):
+        # Workers may still be on a path the widget has since left
+        if not (git_root := git.get_root(path)):
+            return {}
+
+        # None if the whole directory is untracked
+        with trace.span('git status', path=path):
+            return git.get_status(git_root, path, ignored)
+
+    def set_git_status_result(self, git_status):
+        # Everything in an untracked directory is added, which can only be
+        # filled in here once its values are up to date
+        if git_status is None:
+            git_status = dict.fromkeys(self.entries, 'added')
+        self.git_status = git_status
+
+    def watch_values(self, values):
+        self.virtual_size = Size(0, len(values))
+        self.refresh()
+
+    def render_line(self, y):
+        scroll_x, scroll_y = self.scroll_offset
+        index = scroll_y + y
+        width = self.size.width
+
+        if index >= len(self.values):
+            return Strip.blank(width, self.rich_style)
+
+        text = Text(' ')
+        text.append_text(self.render_row(index))
+        strip = Strip(text.render(self.app.console), text.cell_len)
+        return strip.crop_extend(scroll_x, scroll_x + width, None).apply_style(
+            self.get_row_style(index),
+        )
 
-    class Child(Widget):
-    
-        def __init__(self, value, text):
-            super().__init__()
-            self.value = value
-            self.text = text
+    def get_row_style(self, index):
+        return self.rich_style
 
-        def render(self):
-            git_status = self.parent.git_status.get(self.value)
+    def render_row(self, index):
+        value = self.values[index]
+        git_status = self.git_status.get(value)
 
-            text = Text()
-            text.append_text(config.STATUS_GUTTER[git_status])
-            self.render_name(text)
-            return text
+        text = Text()
+        text.append_text(config.STATUS_GUTTER[git_status])
+        self.render_name(text, index)
+        return text
 
-        def render_name(self, text):
-            text.append_text(self.text)
+    def render_name(self, text, index):
+        text.append_text(self.render_value(self.values[index]))
+
+    def render_value(self, value):
+        return Text(value)
@@ -0,0 +1,78 @@
+import os
+import subprocess
+
+from . import trace
+
+
+def is_hidden(value):
+    return any(part.startswith('.') for part in value.split('/'))
+
+
+def find(path, use_git, show_hidden):
+    if use_git and not show_hidden:
+        return (value for value in find_git(path) if not is_hidden(value))
+    else:
+        return find_walk(path, show_hidden)
+
+
+def find_git(path):
+    # This covers the whole stream, including the time spent consuming it
+    with trace.span('git ls-files', path=path):
+        proc = subprocess.Popen(
+            ['git', 'ls-files', '-z', '--cached', '--others', '--exclude-standard', '--deduplicate'],
+            cwd=path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            seen_dirs = set()
+            rest = b''
+
+            while block := proc.stdout.read1(1 << 16):
+                *names, rest = (rest + block).split(b'\0')
+                for name in names:
+                    name = os.fsdecode(name)
+
+                    # Git only lists files, so report their directories the
+                    # first time we see something inside of them
+                    index = name.find('/')
+                    while index != -1:
+                        dir = name[:index + 1]
+                        if dir not in seen_dirs:
+                            seen_dirs.add(dir)
+                            yield dir
+                        index = name.find('/', index + 1)
+
+                    yield name
+        finally:
+            proc.kill()
+            proc.wait()
+
+
+def find_walk(path, show_hidden):
+    stack = ['']
+
+    while stack:
+        prefix = stack.pop()
+        try:
+            it = os.scandir(os.path.join(path, prefix))
+        except OSError:
+            continue
+
+        with it:
+            for entry in it:
+                if entry.name == '.git':
+                    continue
+                if entry.name.startswith('.') and not show_hidden:
+                    continue
+                value = prefix + entry.name
+
+                try:
+                    is_dir = entry.is_dir()
+                    # Do not follow symlinks to avoid walking in circles
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(f'{value}/')
+                except OSError:
+                    is_dir = False
+
+                yield f'{value}/' if is_dir else value
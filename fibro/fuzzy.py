@@ -0,0 +1,88 @@
+from heapq import heapify, heappop
+
+from textual.fuzzy import FuzzySearch
+
+from rich.text import Text
+
+from . import trace
+
+
+class Scorer:
+
+    def __init__(self, query):
+        self.query = query
+        self.search = FuzzySearch()
+
+    def score(self, values):
+        scores = {}
+        with trace.span('fuzzy score', query=self.query):
+            for value in values:
+                score, offsets = self.search.match(self.query, value)
+                if score:
+                    scores[value] = (score, offsets)
+        # We keep the results around ourselves, so there is no need for
+        # FuzzySearch to cache them as well
+        self.search.cache.clear()
+        return scores
+
+
+def highlight(value, offsets, style):
+    text = Text(value)
+    for offset in offsets:
+        if not value[offset].isspace():
+            text.stylize(style, offset, offset + 1)
+    return text
+
+
+# Values ordered by key that are only sorted as far as they are accessed, so
+# we do not have to sort a whole listing to show the first screen of it
+class Ranking:
+
+    def __init__(self, values, key):
+        self.ranked = []
+        self.heap = [(key(value), value) for value in values]
+        heapify(self.heap)
+        self.members = set(values)
+
+    def rank(self, n=None):
+        while self.heap and (n is None or len(self.ranked) < n):
+            self.ranked.append(heappop(self.heap)[1])
+
+    def __len__(self):
+        return len(self.ranked) + len(self.heap)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) or index < 0:
+            self.rank()
+        else:
+            self.rank(index + 1)
+        return self.ranked[index]
+
+    def __setitem__(self, index, value):
+        self.members.discard(self[index])
+        self.members.add(value)
+        self.ranked[index] = value
+
+    def __iter__(self):
+        self.rank()
+        return iter(self.ranked)
+
+    def __contains__(self, value):
+        return value in self.members
+
+    def index(self, value):
+        if value not in self.members:
+            raise ValueError(f'{value!r} is not in ranking')
+        try:
+            return self.ranked.index(value)
+        except ValueError:
+            pass
+        while True:
+            self.rank(len(self.ranked) + 1)
+            if self.ranked[-1] == value:
+                return len(self.ranked) - 1
+
+    def pop(self, index=-1):
+        value = self[index]
+        self.members.discard(value)
+        return self.ranked.pop(index)
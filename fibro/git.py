@@ -0,0 +1,353 @@
+import os
+import stat
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from . import inotify
+from .cache import MTIME_SLACK
+from .git_index import get_index, UnsupportedIndex
+
+
+# With GIT_DIR set git uses that repository wherever it runs, with
+# GIT_WORK_TREE or the directory it runs in as its work tree
+if 'GIT_DIR' in os.environ:
+    GIT_DIR = Path(os.environ['GIT_DIR']).resolve()
+    WORK_TREE = Path(os.environ.get('GIT_WORK_TREE', '.')).resolve()
+else:
+    GIT_DIR = None
+    WORK_TREE = None
+
+# Repository roots by directory, None for directories outside of any. A root
+# is checked to still exist whenever it is used, repositories created later
+# are noticed when a listing sees their .git appear.
+ROOTS = {}
+
+
+def is_root(path):
+    try:
+        mode = os.stat(path / '.git').st_mode
+    except OSError:
+        return False
+    if stat.S_ISDIR(mode):
+        return True
+    # Worktrees and submodules have a file pointing to their git dir
+    try:
+        with open(path / '.git', 'rb') as f:
+            return f.read(7) == b'gitdir:'
+    except OSError:
+        return False
+
+
+def get_root(path):
+    if GIT_DIR is not None:
+        return WORK_TREE if path.is_relative_to(WORK_TREE) else None
+
+    visited = []
+    while True:
+        try:
+            root = ROOTS[path]
+        except KeyError:
+            pass
+        else:
+            if root is None or os.path.lexists(root / '.git'):
+                break
+            forget_roots(root)
+        visited.append(path)
+        if is_root(path):
+            root = path
+            break
+        if path.parent == path:
+            root = None
+            break
+        path = path.parent
+
+    ROOTS.update(dict.fromkeys(visited, root))
+    return root
+
+
+def forget_roots(path):
+    # Forget the roots found for the path and everything below it
+    for directory in list(ROOTS):
+        if directory.is_relative_to(path):
+            ROOTS.pop(directory, None)
+
+
+def get_git_dir(root):
+    if GIT_DIR is not None and root == WORK_TREE:
+        return GIT_DIR
+    git = root / '.git'
+    if git.is_file():
+        content = git.read_text()
+        if content.startswith('gitdir:'):
+            return (root / content.removeprefix('gitdir:').strip()).resolve()
+    return git
+
+
+# Snapshots are invalidated by changes in the directories of their work tree,
+# the events are read by whichever thread next uses a snapshot
+WATCHER = None
+WATCHER_LOCK = threading.Lock()
+
+
+def get_watcher():
+    global WATCHER
+
+    if WATCHER is None:
+        WATCHER = inotify.create() or False
+
+    return WATCHER or None
+
+
+class StatusSnapshot:
+
+    def __init__(self, root):
+        self.root = root
+        self.git_dir = get_git_dir(root)
+        self.lock = threading.Lock()
+        self.stale = True
+        self.signature = None
+        self.created = None
+        self.children = {}
+        self.untracked_dirs = set()
+        # Watches on the directories with tracked files by their path relative
+        # to the root, only used if all of them could be watched
+        self.watches = {}
+        self.watching = False
+
+    def invalidate(self):
+        self.stale = True
+
+    def watch(self):
+        try:
+            names = get_index(self.root, self.git_dir).names
+        except UnsupportedIndex:
+            names = None
+
+        with WATCHER_LOCK:
+            if names is None or (watcher := get_watcher()) is None:
+                self.watching = False
+                return
+
+            dirs = {''}
+            for name in names:
+                parent = name.rpartition('/')[0]
+                while parent not in dirs:
+                    dirs.add(parent)
+                    parent = parent.rpartition('/')[0]
+
+            for name in self.watches.keys() - dirs:
+                watcher.remove_watch(self.watches.pop(name))
+
+            self.watching = True
+            for name in dirs - self.watches.keys():
+                path = self.root / name
+                callback = lambda mask, _, name=name: self.on_change(name, mask)
+                if (watch := watcher.add_watch(path, callback)) is not None:
+                    self.watches[name] = watch
+                elif path.is_dir():
+                    # Out of watches
+                    self.watching = False
+
+            # Whatever happened before git status runs is part of its output
+            watcher.read_all()
+
+    def on_change(self, name, mask):
+        self.stale = True
+        if mask & (inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF):
+            # Watch whatever is at the path from now on
+            if (watch := self.watches.pop(name, None)) is not None:
+                get_watcher().remove_watch(watch)
+
+    def get_signature(self):
+        signature = []
+        for name in ['index', 'HEAD']:
+            try:
+                st = self.git_dir.joinpath(name).stat()
+            except OSError:
+                signature.append(None)
+            else:
+                signature.append((st.st_mtime_ns, st.st_size, st.st_ino))
+        return tuple(signature)
+
+    def is_stale(self, path):
+        if self.watching:
+            with WATCHER_LOCK:
+                get_watcher().read_all()
+        if self.stale or self.get_signature() != self.signature:
+            return True
+        if self.watching:
+            return False
+
+        # Without watches only changes to the listed directory itself show
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            return False
+        return mtime >= self.created - MTIME_SLACK
+
+    def update(self):
+        # Watch before running git status, so changes made while it runs
+        # invalidate the snapshot again
+        self.watch()
+        self.stale = False
+        self.signature = self.get_signature()
+        self.created = time.time_ns()
+
+        res = subprocess.run(
+            ['git', 'status', '--porcelain=v2', '-z', '--untracked-files=normal'],
+            cwd=self.root,
+            capture_output=True,
+            # Keep git from refreshing the index, that would change the
+            # signature we just took
+            env={**os.environ, 'GIT_OPTIONAL_LOCKS': '0'},
+        )
+
+        self.children = {}
+        self.untracked_dirs = set()
+
+        records = iter(os.fsdecode(res.stdout).split('\0'))
+        for record in records:
+            match record[:2]:
+                case '1 ':
+                    _, xy, sub, *_, name = record.split(' ', 8)
+                    if xy[1] != '.':
+                        self.add(name, 'changed', sub.startswith('S'))
+                case '2 ':
+                    _, xy, sub, *_, name = record.split(' ', 9)
+                    next(records, None)
+                    if xy[1] != '.':
+                        self.add(name, 'changed', sub.startswith('S'))
+                case 'u ':
+                    _, _, sub, *_, name = record.split(' ', 10)
+                    self.add(name, 'changed', sub.startswith('S'))
+                case '? ':
+                    name = record[2:]
+                    is_dir = name.endswith('/')
+                    name = name.rstrip('/')
+                    if is_dir:
+                        self.untracked_dirs.add(name)
+                    self.add(name, 'added', is_dir)
+
+    def add(self, name, status, is_dir):
+        *parents, name = name.split('/')
+
+        parent = ''
+        for part in parents:
+            self.children.setdefault(parent, {})[f'{part}/'] = 'changed'
+            parent = f'{parent}{part}/'
+
+        if is_dir:
+            name += '/'
+        self.children.setdefault(parent, {})[name] = status
+
+    def get_status(self, path):
+        with self.lock:
+            if self.is_stale(path):
+                self.update()
+
+            parent = ''
+            for part in path.relative_to(self.root).parts:
+                parent = f'{parent}{part}'
+                if parent in self.untracked_dirs:
+                    return None
+                parent += '/'
+
+            return dict(self.children.get(parent, {}))
+
+
+SNAPSHOTS = {}
+SNAPSHOTS_LOCK = threading.Lock()
+
+
+def get_snapshot(root):
+    root = Path(root)
+    with SNAPSHOTS_LOCK:
+        try:
+            return SNAPSHOTS[root]
+        except KeyError:
+            snapshot = SNAPSHOTS[root] = StatusSnapshot(root)
+            return snapshot
+
+
+def get_status(root, path, ignored=frozenset()):
+    snapshot = get_snapshot(root)
+    try:
+        index = get_index(root, snapshot.git_dir)
+    except UnsupportedIndex:
+        return snapshot.get_status(path)
+
+    prefix = ''.join(f'{part}/' for part in path.relative_to(root).parts)
+    if prefix and not index.has_dir(prefix):
+        return snapshot.get_status(path)
+
+    git_status = {}
+    # Entries whose status can not be determined from the index alone
+    unknown = []
+
+    try:
+        it = os.scandir(path)
+    except OSError:
+        return git_status
+
+    with it:
+        for entry in it:
+            if entry.name in ignored or entry.name == '.git':
+                continue
+            name = prefix + entry.name
+
+            try:
+                value = f'{entry.name}/' if entry.is_dir() else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if index.has_dir(f'{name}/') or name in index.entries:
+                        unknown.append(value)
+                    else:
+                        git_status[value] = 'added'
+                elif name not in index.entries:
+                    git_status[value] = 'added'
+                else:
+                    match index.is_modified(name, entry.stat(follow_symlinks=False)):
+                        case True:
+                            git_status[value] = 'changed'
+                        case None:
+                            unknown.append(value)
+            except OSError:
+                continue
+
+    if unknown:
+        snapshot_status = snapshot.get_status(path) or {}
+        for value in unknown:
+            if status := snapshot_status.get(value):
+                git_status[value] = status
+
+    return git_status
+
+
+def is_clean(root, path):
+    try:
+        index = get_index(root, get_snapshot(root).git_dir)
+        name = path.relative_to(root).as_posix()
+        if name not in index.entries:
+            return False
+        return index.is_modified(name, path.lstat()) is False
+    except (UnsupportedIndex, OSError):
+        return False
+
+
+def get_oid(root, path):
+    try:
+        index = get_index(root, get_snapshot(root).git_dir)
+    except UnsupportedIndex:
+        return None
+    try:
+        return index.entries[path.relative_to(root).as_posix()].oid
+    except KeyError:
+        return None
+
+
+def invalidate(root):
+    with SNAPSHOTS_LOCK:
+        snapshot = SNAPSHOTS.get(Path(root))
+    if snapshot is not None:
+        snapshot.invalidate()
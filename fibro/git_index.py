@@ -0,0 +1,211 @@
+import hashlib
+import os
+import re
+import stat
+import struct
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+
+
+class UnsupportedIndex(Exception):
+    pass
+
+
+IndexEntry = namedtuple('IndexEntry', [
+    'ctime_s', 'ctime_ns', 'mtime_s', 'mtime_ns', 'dev', 'ino', 'mode',
+    'uid', 'gid', 'size', 'oid', 'flags',
+])
+
+
+ENTRY_HEADER = struct.Struct('>10I')
+HEADER = struct.Struct('>4sII')
+EXTENSION_HEADER = struct.Struct('>4sI')
+
+FLAG_EXTENDED = 0x4000
+FLAG_STAGE = 0x3000
+FLAG_INTENT_TO_ADD = 0x2000
+FLAG_SKIP_WORKTREE = 0x4000
+
+MODE_GITLINK = 0o160000
+
+# Files whose stat data changed but whose size did not are hashed to see if
+# their content is still that of the index, up to this size
+HASH_LIMIT = 4 * 1024 * 1024
+
+
+def read_varint(data, pos):
+    byte = data[pos]
+    pos += 1
+    value = byte & 0x7f
+    while byte & 0x80:
+        byte = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (byte & 0x7f)
+    return value, pos
+
+
+def get_hash_name(git_dir):
+    # Worktrees keep their config in the common dir
+    for config in [git_dir / 'config', git_dir / '../../config']:
+        try:
+            content = config.read_text()
+        except OSError:
+            continue
+        if re.search(r'^\s*objectformat\s*=\s*sha256\s*$', content, re.I | re.M):
+            return 'sha256'
+        break
+    return 'sha1'
+
+
+class Index:
+
+    def __init__(self, root, data, hash_name, mtime):
+        self.root = root
+        self.hash_name = hash_name
+        self.mtime = mtime
+        hash_len = hashlib.new(hash_name).digest_size
+
+        signature, self.version, count = HEADER.unpack_from(data)
+        if signature != b'DIRC' or self.version not in (2, 3, 4):
+            raise UnsupportedIndex(f'unsupported index version: {self.version}')
+
+        self.entries = {}
+        self.unmerged = set()
+
+        pos = HEADER.size
+        name = b''
+        for _ in range(count):
+            start = pos
+            fields = ENTRY_HEADER.unpack_from(data, pos)
+            pos += ENTRY_HEADER.size
+            oid = data[pos:pos + hash_len]
+            pos += hash_len
+            flags, = struct.unpack_from('>H', data, pos)
+            pos += 2
+            if flags & FLAG_EXTENDED:
+                if self.version < 3:
+                    raise UnsupportedIndex('extended flags in index version 2')
+                extended_flags, = struct.unpack_from('>H', data, pos)
+                pos += 2
+            else:
+                extended_flags = 0
+
+            if self.version == 4:
+                strip, pos = read_varint(data, pos)
+                end = data.index(b'\0', pos)
+                name = name[:len(name) - strip] + data[pos:end]
+                pos = end + 1
+            else:
+                end = data.index(b'\0', pos)
+                name = data[pos:end]
+                # Entries are padded with 1 to 8 nul bytes to a multiple of 8
+                pos = start + ((end - start) // 8 + 1) * 8
+
+            path = os.fsdecode(name)
+            if flags & FLAG_STAGE:
+                self.unmerged.add(path)
+            self.entries[path] = IndexEntry(*fields, oid, (extended_flags << 16) | flags)
+
+        end = len(data) - hash_len
+        while pos < end:
+            signature, size = EXTENSION_HEADER.unpack_from(data, pos)
+            # Extensions starting with an uppercase letter are optional,
+            # anything else changes how the entries have to be interpreted
+            if not signature[:1].isupper():
+                raise UnsupportedIndex(f'unsupported index extension: {signature!r}')
+            pos += EXTENSION_HEADER.size + size
+
+        self.names = sorted(self.entries)
+
+    def has_dir(self, prefix):
+        index = bisect_left(self.names, prefix)
+        return index < len(self.names) and self.names[index].startswith(prefix)
+
+    def is_modified(self, name, st):
+        entry = self.entries[name]
+
+        if name in self.unmerged or entry.mode == MODE_GITLINK:
+            return None
+        if entry.flags & (FLAG_SKIP_WORKTREE << 16):
+            return False
+        if entry.flags & (FLAG_INTENT_TO_ADD << 16):
+            return True
+
+        if stat.S_IFMT(st.st_mode) != stat.S_IFMT(entry.mode):
+            return True
+        if stat.S_ISREG(st.st_mode) and (st.st_mode ^ entry.mode) & 0o100:
+            return True
+        if st.st_size & 0xffffffff != entry.size:
+            return True
+
+        mtime = (int(st.st_mtime) & 0xffffffff, st.st_mtime_ns % 1_000_000_000)
+        ctime = (int(st.st_ctime) & 0xffffffff, st.st_ctime_ns % 1_000_000_000)
+        if (
+            mtime == (entry.mtime_s, entry.mtime_ns) and
+            ctime == (entry.ctime_s, entry.ctime_ns) and
+            st.st_ino & 0xffffffff == entry.ino
+        ):
+            # Files changed in the same timestamp tick as the index was
+            # written can not be told apart from clean ones by their stat
+            # data alone
+            if mtime >= self.mtime:
+                return None
+            return False
+
+        # Only the stat data changed, which git status would refresh. The
+        # raw content matching the blob means the file is clean, anything
+        # else is left to git as clean and smudge filters, line ending
+        # conversion and LFS can make a clean file differ from its blob.
+        if not stat.S_ISREG(st.st_mode) or st.st_size > HASH_LIMIT:
+            return None
+        if self.hash_file(name, st) == entry.oid:
+            return False
+        return None
+
+    def hash_file(self, name, st):
+        try:
+            with open(self.root / name, 'rb') as f:
+                content = f.read()
+        except OSError:
+            return None
+        digest = hashlib.new(self.hash_name)
+        digest.update(b'blob %d\0' % len(content))
+        digest.update(content)
+        return digest.digest()
+
+
+INDEX_CACHE = {}
+INDEX_CACHE_LOCK = threading.Lock()
+
+
+def get_index(root, git_dir):
+    path = git_dir / 'index'
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        raise UnsupportedIndex('no index')
+    signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    with INDEX_CACHE_LOCK:
+        try:
+            cached_signature, index = INDEX_CACHE[git_dir]
+        except KeyError:
+            pass
+        else:
+            if cached_signature == signature:
+                return index
+
+        try:
+            data = path.read_bytes()
+            index = Index(
+                root,
+                data,
+                get_hash_name(git_dir),
+                (int(st.st_mtime) & 0xffffffff, st.st_mtime_ns % 1_000_000_000),
+            )
+        except (OSError, struct.error, ValueError, IndexError) as e:
+            raise UnsupportedIndex(str(e)) from e
+
+        INDEX_CACHE[git_dir] = signature, index
+        return index
@@ -1,19 +1,39 @@
+import sys
+import threading
 from collections import Counter
-from difflib import ndiff
+from heapq import heappop, heappush
 
-from textual.widget import Widget
-from textual.widgets import Static
+from textual.cache import LRUCache
+from textual.geometry import Size
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
 from textual._tree_sitter import BUILTIN_LANGUAGES
 
+from rich.style import Style
 from rich.text import Text
 
 from tree_sitter import Parser
 
-from . import config
+from . import config, trace
+from .diff import get_line_status
 
 
 QUERIES = config.HELIX / 'runtime/queries'
 QUERY_CACHE = {}
+# Queries are shared and restricting them to a range changes them in place
+QUERY_LOCK = threading.Lock()
+
+NULL_STYLE = Style()
+
+# Lines are highlighted in blocks of this many lines when they are first shown
+BLOCK_SIZE = 256
+BLOCK_CACHE_SIZE = 32
+
+# Rough memory used by parts of a document that can not be measured directly,
+# taken from highlighting a range of source files
+TREE_NODE_SIZE = 112
+RENDERED_LINE_SIZE = 300
+RENDERED_CHAR_SIZE = 16
 
 
 def get_query(language, name):
@@ -51,44 +71,145 @@ def event_key(event):
     return (pos, EVENT_TYPE_ORDER[event_type])
 
 
-class Highlight(Widget):
+def get_common_prefix(a, b):
+    # Compare halves at a time so most of the work happens in C
+    low = 0
+    high = min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[low:mid] == b[low:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
 
-    def __init__(self, old_content, new_content, language):
-        super().__init__()
-        self.old_content = old_content
-        self.new_content = new_content
+
+def get_common_suffix(a, b):
+    low = 0
+    high = min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[len(a) - mid:len(a) - low] == b[len(b) - mid:len(b) - low]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def get_point(source, offset):
+    row = source.count(b'\n', 0, offset)
+    return (row, offset - source.rfind(b'\n', 0, offset) - 1)
+
+
+def split_lines(content):
+    lines = content.split('\n')
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+# Everything the sweep over the events has to remember from one block to the
+# next, so a block can be highlighted without going over the ones before it
+class SweepState:
+
+    def __init__(self, scopes, definitions, references, highlights, active):
+        self.scopes = scopes
+        self.definitions = definitions
+        self.references = references
+        self.highlights = highlights
+        # Heap of highlights that were active at some point, ones that are no
+        # longer active are only removed once they reach the top, but every
+        # highlight is only in there once
+        self.active = active
+        self.queued = set(active)
+
+    def copy(self):
+        return SweepState(
+            [list(scope) for scope in self.scopes],
+            {key: list(styles) for key, styles in self.definitions.items()},
+            Counter(self.references),
+            Counter(self.highlights),
+            list(self.active),
+        )
+
+    def get_style(self):
+        if self.references:
+            for reference in sorted(self.references):
+                try:
+                    return self.definitions[reference][-1]
+                except KeyError:
+                    pass
+
+        active = self.active
+        while active and active[0] not in self.highlights:
+            self.queued.discard(heappop(active))
+        if active:
+            return config.get_key_style(active[0][1])
+        return NULL_STYLE
+
+    def apply(self, event):
+        match event:
+            case (_, 'scope_start'):
+                self.scopes.append([])
+
+            case (_, 'scope_end'):
+                for key in self.scopes.pop():
+                    self.definitions[key].pop()
+                    if not self.definitions[key]:
+                        del self.definitions[key]
+
+            case (_, 'definition', key):
+                style = self.get_style()
+                self.definitions.setdefault(key, []).append(style)
+                self.scopes[-1].append(key)
+
+            case (_, 'reference_start', key):
+                self.references[key] += 1
+
+            case (_, 'reference_end', key):
+                self.references[key] -= 1
+                if not self.references[key]:
+                    del self.references[key]
+
+            case (_, 'highlight_start' | 'highlight_end', None):
+                pass
+
+            case (_, 'highlight_start', key):
+                if key not in self.queued:
+                    heappush(self.active, key)
+                    self.queued.add(key)
+                self.highlights[key] += 1
+
+            case (_, 'highlight_end', key):
+                self.highlights[key] -= 1
+                if not self.highlights[key]:
+                    del self.highlights[key]
+
+            case event:
+                raise ValueError(f'unknown event: {event}')
+
+
+# Everything needed to show a file, this is prepared in the background while
+# the highlighting itself only happens once lines are shown
+class Document:
+
+    def __init__(self, old_content, new_content, language, previous=None):
         self.language = language
+        self.source = new_content.encode()
+        self.lock = threading.Lock()
 
-    def compose(self):
-        lines = self.new_content.split('\n')
-        while lines and not lines[-1]:
-            lines.pop()
+        lines = split_lines(new_content)
 
-        if self.new_content is self.old_content:
+        if new_content is old_content:
             git_status = [None for _ in lines]
         else:
-            old_lines = self.old_content.split('\n')
-            while old_lines and not old_lines[-1]:
-                old_lines.pop()
-
-            git_status = []
-            next_line = 'added'
-
-            for line in ndiff(old_lines, lines):
-                match line[0]:
-                    case ' ':
-                        git_status.append(None)
-                    case '+':
-                        git_status.append(next_line)
-                        next_line = 'added'
-                    case '?':
-                        next_line = 'changed'
+            with trace.span('diff', lines=len(lines)):
+                git_status = get_line_status(split_lines(old_content), lines)
 
         assert len(git_status) == len(lines)
 
-        if not lines:
-            yield Static('')
-            return
+        self.git_status = git_status
+        self.width = max((len(line.expandtabs()) for line in lines), default=0)
 
         # Try to autodetect indent
         for line in lines:
@@ -104,7 +225,8 @@ class Highlight(Widget):
         else:
             indent = '    '
 
-        indent_text = Text(
+        self.indent = indent
+        self.indent_text = Text(
             '│' + indent.replace('\t', '    ')[1:],
             style=config.get_style('ui.virtual.indent-guide'),
         )
@@ -129,21 +251,116 @@ class Highlight(Widget):
         for index in range(last_index, len(lines)):
             lines[index] = ''
 
-        # Gather all events
+        self.lines = lines
+
+        self.linenr_width = max(len(str(len(lines))), 4)
+        self.linenr_style = config.get_style('ui.linenr')
+
+        # The state at the start of every block that has been swept so far,
+        # these are kept so we can always continue from the last one
+        self.states = [SweepState([[]], {}, Counter(), Counter(), [])]
+        self.blocks = LRUCache(BLOCK_CACHE_SIZE)
+
+        if language is None:
+            self.syntax_tree = None
+        elif (
+            previous is None or
+            previous.language != language or
+            previous.indent != indent
+        ):
+            with trace.span('parse', language=language, size=len(self.source)):
+                self.syntax_tree = Parser(BUILTIN_LANGUAGES[language]).parse(self.source)
+        else:
+            self.reparse(previous)
+
+    def reparse(self, previous):
+        # Take over the tree of the previous document, since editing it
+        # makes it useless for that document
+        with previous.lock:
+            old_tree = previous.syntax_tree
+            previous.syntax_tree = None
+            states = previous.states
+            blocks = {
+                block: lines
+                for block in previous.blocks.keys()
+                if (lines := previous.blocks.get(block)) is not None
+            }
+
+        if old_tree is None:
+            with trace.span('parse', language=self.language, size=len(self.source)):
+                self.syntax_tree = Parser(BUILTIN_LANGUAGES[self.language]).parse(self.source)
+            return
+
+        # Describe the change as a single edit replacing everything between
+        # the common prefix and suffix
+        old_source = previous.source
+        new_source = self.source
+        start = get_common_prefix(old_source, new_source)
+        suffix = get_common_suffix(old_source[start:], new_source[start:])
+        old_end = len(old_source) - suffix
+        new_end = len(new_source) - suffix
+
+        start_point = get_point(new_source, start)
+        old_tree.edit(
+            start_byte=start,
+            old_end_byte=old_end,
+            new_end_byte=new_end,
+            start_point=start_point,
+            old_end_point=get_point(old_source, old_end),
+            new_end_point=get_point(new_source, new_end),
+        )
+        with trace.span('reparse', language=self.language, size=len(new_source)):
+            self.syntax_tree = Parser(BUILTIN_LANGUAGES[self.language]).parse(new_source, old_tree)
+
+        # Highlighting only changes from the edit or the first node whose
+        # structure changed, whichever comes first, and the indent of empty
+        # lines depends on the line after them
+        reuse_line = min(
+            [start_point[0]] +
+            [change.start_point[0] for change in old_tree.changed_ranges(self.syntax_tree)]
+        )
+        reuse_line = min(reuse_line, len(self.lines), len(previous.lines))
+        raw_lines = split_lines(new_source[:start].decode(errors='replace'))
+        while reuse_line > 0 and (
+            reuse_line > len(raw_lines) or
+            not raw_lines[reuse_line - 1] or
+            raw_lines[reuse_line - 1].isspace()
+        ):
+            reuse_line -= 1
+
+        reuse_blocks = min(reuse_line // BLOCK_SIZE, len(states) - 1)
+        self.states = states[:reuse_blocks + 1]
+        for block in range(reuse_blocks):
+            if block in blocks:
+                self.blocks[block] = blocks[block]
+
+    def get_events(self, start, end):
         events = []
+        if self.syntax_tree is None:
+            return events
 
-        if self.language is not None:
-            syntax_tree = Parser(BUILTIN_LANGUAGES[self.language]).parse(self.new_content.encode())
+        start_point = (start, 0)
+        end_point = (end, 0)
+        root_node = self.syntax_tree.root_node
 
+        with QUERY_LOCK:
             if highlights_query := get_query(self.language, 'highlights.scm'):
-                for pattern, captures in highlights_query.matches(syntax_tree.root_node):
+                highlights_query.set_point_range([start_point, end_point])
+                for pattern, captures in highlights_query.matches(root_node):
                     for key, nodes in captures.items():
+                        # Captures the theme has no style for never decide
+                        # the style of anything, they only split chunks
+                        if config.get_key_style(key) is None:
+                            key = None
+                        else:
+                            key = (pattern, key)
                         for node in nodes:
-                            events.append((node.start_point, 'highlight_start', (pattern, key)))
-                            events.append((node.end_point, 'highlight_end', (pattern, key)))
+                            events.append((node.start_point, 'highlight_start', key))
+                            events.append((node.end_point, 'highlight_end', key))
 
             if locals_query := get_query(self.language, 'locals.scm'):
-                for key, nodes in locals_query.captures(syntax_tree.root_node).items():
+                locals_query.set_point_range([start_point, end_point])
+                for key, nodes in locals_query.captures(root_node).items():
                     for node in nodes:
                         match key:
                             case 'local.scope':
@@ -155,67 +372,66 @@ class Highlight(Widget):
                                 events.append((node.start_point, 'reference_start', node.text))
                                 events.append((node.end_point, 'reference_end', node.text))
 
-            events.sort(key=event_key, reverse=True)
-
-        # Determine chunks
-        line = 0
+        # Nodes overlapping the block are matched as a whole, events outside
+        # of it belong to the blocks before and after
+        events = [event for event in events if start_point <= event[0] < end_point]
+        events.sort(key=event_key, reverse=True)
+        return events
+
+    def get_size(self):
+        # Memory used once as many blocks are rendered as are kept
+        size = sys.getsizeof(self.source) + sys.getsizeof(self.git_status)
+        size += sys.getsizeof(self.lines) + sum(map(sys.getsizeof, self.lines))
+        if self.syntax_tree is not None:
+            size += self.syntax_tree.root_node.descendant_count * TREE_NODE_SIZE
+        if self.lines:
+            rendered = min(len(self.lines), BLOCK_CACHE_SIZE * BLOCK_SIZE) / len(self.lines)
+            size += rendered * (
+                RENDERED_LINE_SIZE * len(self.lines) + RENDERED_CHAR_SIZE * len(self.source)
+            )
+        return int(size)
+
+    def get_block(self, block):
+        with self.lock:
+            try:
+                return self.blocks[block]
+            except KeyError:
+                pass
+
+            # Blocks we skipped over only have to be swept for their end state
+            while len(self.states) <= block:
+                events = self.get_events(*self.get_block_range(len(self.states) - 1))
+                state = self.states[-1].copy()
+                while events:
+                    state.apply(events.pop())
+                self.states.append(state)
+
+            with trace.span('highlight block', block=block):
+                lines = self.blocks[block] = self.render_block(block)
+            return lines
+
+    def get_block_range(self, block):
+        start = block * BLOCK_SIZE
+        return start, min(start + BLOCK_SIZE, len(self.lines))
+
+    def render_block(self, block):
+        start, end = self.get_block_range(block)
+        events = self.get_events(start, end)
+        state = self.states[block].copy()
+
+        lines = self.lines
+        indent = self.indent
+        rendered = []
+
+        line = start
         column = 0
-
-        scopes = [[]]
-        definitions = {}
-        references = Counter()
-        highlights = Counter()
-
-        def get_curr_style():
-            for reference in sorted(references):
-                try:
-                    return definitions[reference][-1]
-                except KeyError:
-                    pass
-            return config.get_style(key for _, key in sorted(highlights))
-
-        max_line_len = max(len(str(len(lines))), 4)
-        linenr_style = config.get_style('ui.linenr')
         curr_line = Text()
+        end_point = (end, 0)
 
-        end_point = (len(lines), 0)
-
-        while line < len(lines):
+        while line < end:
             # Pop all events that should be applied
             while events and (line, column) >= events[-1][0]:
-                match events.pop():
-                    case (_, 'scope_start'):
-                        scopes.append([])
-
-                    case (_, 'scope_end'):
-                        for key in scopes.pop():                            
-                            definitions[key].pop()
-                            if not definitions[key]:
-                                del definitions[key]
-
-                    case (_, 'definition', key):
-                        style = get_curr_style()
-                        definitions.setdefault(key, []).append(style)
-                        scopes[-1].append(key)
-
-                    case (_, 'reference_start', key):
-                        references[key] += 1
-
-                    case (_, 'reference_end', key):
-                        references[key] -= 1
-                        if not references[key]:
-                            del references[key]
-
-                    case (_, 'highlight_start', key):
-                        highlights[key] += 1
-
-                    case (_, 'highlight_end', key):
-                        highlights[key] -= 1
-                        if not highlights[key]:
-                            del highlights[key]
-
-                    case event:
-                        raise ValueError(f'unknown event: {event}')
+                state.apply(events.pop())
 
             # Either go to the next event or the end
             try:
@@ -227,32 +443,63 @@ class Highlight(Widget):
             next_line, next_column = next_point
 
             # Add all chunks
-            style = get_curr_style()
+            style = state.get_style()
 
             while (line, column) < (next_line, next_column):
                 if column == 0:
-                    # Add line number
-                    curr_line.append_text(Text(
-                        str(line + 1).rjust(max_line_len) + ' ',
-                        style=linenr_style,
-                    ))
-                    # Add diff
-                    curr_line.append_text(config.STATUS_GUTTER[git_status[line]])
                     # Add indent
                     while (
                         lines[line].startswith(indent, column) and
                         (line, column + len(indent)) <= (next_line, next_column)
                     ):
-                        curr_line.append_text(indent_text)
+                        curr_line.append_text(self.indent_text)
                         column += len(indent)
 
                 # Add rest of line
                 if line < next_line:
-                    curr_line.append_text(Text(lines[line][column:], style=style))
-                    yield Static(curr_line)
+                    curr_line.append(lines[line][column:], style)
+                    curr_line.expand_tabs()
+                    rendered.append(curr_line)
                     curr_line = Text()
                     line += 1
                     column = 0
                 else:
-                    curr_line.append_text(Text(lines[line][column:next_column], style=style))
+                    curr_line.append(lines[line][column:next_column], style)
                     column = next_column
+
+        if block + 1 == len(self.states):
+            while events:
+                state.apply(events.pop())
+            self.states.append(state)
+
+        return rendered
+
+
+class Highlight(ScrollView, can_focus=False):
+
+    def __init__(self, document):
+        super().__init__()
+        self.document = document
+
+    def on_mount(self):
+        document = self.document
+        self.virtual_size = Size(document.linenr_width + document.width + 3, len(document.lines))
+
+    def render_line(self, y):
+        scroll_x, scroll_y = self.scroll_offset
+        index = scroll_y + y
+        width = self.size.width
+        document = self.document
+
+        if index >= len(document.lines):
+            return Strip.blank(width, self.rich_style)
+
+        text = Text(' ')
+        text.append_text(Text(
+            str(index + 1).rjust(document.linenr_width) + ' ',
+            style=document.linenr_style,
+        ))
+        text.append_text(config.STATUS_GUTTER[document.git_status[index]])
+        text.append_text(document.get_block(index // BLOCK_SIZE)[index % BLOCK_SIZE])
+        strip = Strip(text.render(self.app.console), text.cell_len)
+        return strip.crop_extend(scroll_x, scroll_x + width, None).apply_style(self.rich_style)
@@ -0,0 +1,130 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+DIRECTORY_EVENTS = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+    IN_DELETE_SELF | IN_MOVE_SELF
+)
+
+EVENT = struct.Struct('iIII')
+
+
+class Inotify:
+
+    def __init__(self, libc, loop=None):
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.callbacks = {}
+        # Without a loop whoever uses it reads the events with read_all
+        if loop is not None:
+            loop.add_reader(self.fd, self.read)
+
+    def add_watch(self, path, callback):
+        wd = self.libc.inotify_add_watch(
+            self.fd,
+            os.fsencode(path),
+            DIRECTORY_EVENTS | IN_ONLYDIR,
+        )
+        if wd < 0:
+            return None
+        # The same directory gives the same watch descriptor, so keep track
+        # of everyone interested in it
+        self.callbacks.setdefault(wd, []).append(callback)
+        return wd, callback
+
+    def remove_watch(self, watch):
+        wd, callback = watch
+        try:
+            callbacks = self.callbacks[wd]
+            callbacks.remove(callback)
+        except (KeyError, ValueError):
+            return
+        if not callbacks:
+            del self.callbacks[wd]
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, pos)
+            pos += EVENT.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b'\0'))
+            pos += length
+
+            if mask & IN_Q_OVERFLOW:
+                # We lost events, so everyone has to assume everything changed
+                for callbacks in self.callbacks.values():
+                    for callback in list(callbacks):
+                        callback(mask, None)
+                continue
+
+            if mask & IN_IGNORED:
+                self.callbacks.pop(wd, None)
+                continue
+
+            for callback in list(self.callbacks.get(wd, ())):
+                callback(mask, name)
+
+        return True
+
+    def read_all(self):
+        while self.read():
+            pass
+
+
+def create(loop=None):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        return Inotify(libc, loop)
+    except (OSError, AttributeError):
+        return None
+
+
+INOTIFY = None
+
+
+def get_inotify():
+    global INOTIFY
+
+    if INOTIFY is None:
+        INOTIFY = create(asyncio.get_running_loop()) or False
+
+    return INOTIFY or None
+
+
+def add_watch(path, callback):
+    if inotify := get_inotify():
+        return inotify.add_watch(path, callback)
+    return None
+
+
+def remove_watch(watch):
+    if watch is not None and (inotify := get_inotify()):
+        inotify.remove_watch(watch)
@@ -0,0 +1,549 @@
+import errno
+import os
+import queue
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from . import config
+
+
+# Files are copied in pieces of this size, progress and cancellation are
+# checked in between
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+# Files in a tree are copied by this many threads, with at most
+# COPY_QUEUE_SIZE of them waiting for a thread at a time
+COPY_THREADS = min(8, os.cpu_count() or 1)
+COPY_QUEUE_SIZE = 4 * COPY_THREADS
+
+# Deleted paths are renamed into a staging directory on their filesystem and
+# unlinked from there in the background by this many threads
+RECLAIM_THREADS = min(8, os.cpu_count() or 1)
+STAGING_HOME = config.XDG_CACHE_HOME / 'fibro/staging'
+# Staging directories on other filesystems than the one of STAGING_HOME are
+# listed here, so whatever is left in them can be reclaimed on the next start
+STAGING_LIST = config.XDG_CACHE_HOME / 'fibro/staging-dirs'
+
+# ioctl to share the data of a file on copy-on-write filesystems
+FICLONE = 0x40049409
+
+# Errors meaning a way of copying is not supported here, which are only
+# returned before any data was copied
+UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+    errno.EBADF,
+    errno.EPERM,
+}
+
+VERBS = {
+    'move': 'moving',
+    'copy': 'copying',
+    'delete': 'deleting',
+}
+
+
+class Cancelled(Exception):
+    pass
+
+
+def clone(src, dst):
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(dst, FICLONE, src)
+    except OSError:
+        return False
+    return True
+
+
+def copy_file_range(src, dst, count):
+    return os.copy_file_range(src, dst, count)
+
+
+def sendfile(src, dst, count):
+    return os.sendfile(dst, src, None, count)
+
+
+# Ways to copy in the kernel, from fastest to slowest
+KERNEL_COPIES = [
+    *([copy_file_range] if hasattr(os, 'copy_file_range') else []),
+    *([sendfile] if hasattr(os, 'sendfile') else []),
+]
+
+
+def format_size(size):
+    for unit in ['B', 'kB', 'MB', 'GB']:
+        if size < 1000:
+            break
+        size /= 1000
+    else:
+        unit = 'TB'
+    return f'{size:.0f}{unit}' if unit == 'B' else f'{size:.1f}{unit}'
+
+
+# Staging directories by device, None if a device has none we can use
+STAGING_DIRS = {}
+STAGING_LOCK = threading.Lock()
+
+
+def get_staging_dir(device, path):
+    with STAGING_LOCK:
+        try:
+            return STAGING_DIRS[device]
+        except KeyError:
+            pass
+
+        staging_dir = None
+        try:
+            STAGING_HOME.mkdir(mode=0o700, parents=True, exist_ok=True)
+            if STAGING_HOME.stat().st_dev == device:
+                staging_dir = STAGING_HOME
+            else:
+                # Like the trash, use the root of the filesystem
+                root = path
+                while root.parent != root and root.parent.stat().st_dev == device:
+                    root = root.parent
+                private_dir = root / f'.fibro-staging-{os.getuid()}'
+                private_dir.mkdir(mode=0o700, exist_ok=True)
+                if is_private_dir(private_dir):
+                    staging_dir = private_dir
+                    if str(staging_dir) not in get_staging_list():
+                        with STAGING_LIST.open('a') as f:
+                            f.write(f'{staging_dir}\n')
+        except OSError:
+            staging_dir = None
+
+        STAGING_DIRS[device] = staging_dir
+        return staging_dir
+
+
+def is_private_dir(path):
+    # The root of a filesystem can be writable by anyone, so like the trash
+    # only use a directory that is ours alone and not a symlink to one
+    try:
+        st = path.lstat()
+    except OSError:
+        return False
+    return (
+        stat.S_ISDIR(st.st_mode) and
+        st.st_uid == os.getuid() and
+        not st.st_mode & (stat.S_IRWXG | stat.S_IRWXO)
+    )
+
+
+def get_staging_list():
+    try:
+        return STAGING_LIST.read_text().splitlines()
+    except OSError:
+        return []
+
+
+def stage(path):
+    # Returns where the path was moved to, or None if it could not be
+    try:
+        device = path.lstat().st_dev
+    except OSError:
+        return None
+    if (staging_dir := get_staging_dir(device, path.parent)) is None:
+        return None
+
+    # Every deleted path gets a directory of its own, so names never clash
+    try:
+        staged = tempfile.mkdtemp(dir=staging_dir)
+    except OSError:
+        return None
+    try:
+        path.rename(os.path.join(staged, path.name))
+    except OSError:
+        try:
+            os.rmdir(staged)
+        except OSError:
+            # Reclaimed already by another instance resuming
+            pass
+        return None
+    return staged
+
+
+class Reclaimer:
+
+    def __init__(self):
+        # Directories to empty together with the directory they are in and
+        # the staged directory they belong to
+        self.queue = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        # Directories being emptied mapped to the directory they are in and
+        # how many of their subdirectories are left
+        self.remaining = {}
+        # The first error for each staged directory that could not be emptied
+        self.errors = {}
+        # Called from the reclaim threads with the staged directory and the
+        # error when something is left in it
+        self.report = None
+        self.threads = []
+
+    def reclaim(self, path):
+        if not self.threads:
+            # Daemon threads, whatever they do not get to on exit is resumed
+            # on the next start
+            for _ in range(RECLAIM_THREADS):
+                thread = threading.Thread(target=self.work, name='reclaim', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+        self.queue.put((path, None, path))
+
+    def resume(self):
+        staging_dirs = [
+            Path(staging_dir)
+            for staging_dir in get_staging_list()
+            if is_private_dir(Path(staging_dir))
+        ]
+        for staging_dir in [STAGING_HOME, *staging_dirs]:
+            try:
+                with os.scandir(staging_dir) as it:
+                    for entry in it:
+                        self.reclaim(entry.path)
+            except OSError:
+                pass
+
+    def fail(self, root, error):
+        # Gone already is fine, another instance may be reclaiming as well
+        if not isinstance(error, FileNotFoundError):
+            with self.lock:
+                self.errors.setdefault(root, error)
+
+    def work(self):
+        while True:
+            path, parent, root = self.queue.get()
+
+            dirs = []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                dirs.append(entry.path)
+                            else:
+                                os.unlink(entry.path)
+                        except OSError as e:
+                            self.fail(root, e)
+            except NotADirectoryError:
+                try:
+                    os.unlink(path)
+                except OSError as e:
+                    self.fail(root, e)
+            except OSError as e:
+                self.fail(root, e)
+
+            if dirs:
+                with self.lock:
+                    self.remaining[path] = [parent, len(dirs)]
+                for child in dirs:
+                    self.queue.put((child, path, root))
+            else:
+                self.remove(path, parent, root)
+
+    def remove(self, path, parent, root):
+        # Remove a directory that has been emptied, and then its parents if
+        # they have been emptied as well
+        while True:
+            try:
+                os.rmdir(path)
+            except NotADirectoryError:
+                pass
+            except OSError as e:
+                self.fail(root, e)
+
+            if parent is None:
+                break
+
+            with self.lock:
+                remaining = self.remaining[parent]
+                remaining[1] -= 1
+                if remaining[1]:
+                    return
+                del self.remaining[parent]
+            path, parent = parent, remaining[0]
+
+        # Whatever could not be removed is left for the next start
+        with self.lock:
+            error = self.errors.pop(root, None)
+        if error is not None and self.report is not None:
+            self.report(root, error)
+
+
+RECLAIMER = Reclaimer()
+
+
+def is_same_device(path, dest):
+    try:
+        return path.lstat().st_dev == dest.parent.stat().st_dev
+    except OSError:
+        return True
+
+
+def check_free(dest):
+    # Overwriting was asked for when the job was queued, anything that has
+    # appeared since, like from a job queued earlier, is left alone
+    if os.path.lexists(dest):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), str(dest))
+
+
+class Job:
+
+    def __init__(self, kind, operations):
+        self.kind = kind
+        # Tuples of an action, a path and a destination if the action has one
+        self.operations = operations
+        self.cancelled = threading.Event()
+
+        # Files are copied by several threads at once
+        self.lock = threading.Lock()
+        self.started = None
+        self.files = 0
+        self.bytes = 0
+        self.total_files = None
+        self.total_bytes = None
+        self.error = None
+
+    @property
+    def paths(self):
+        for _, path, dest in self.operations:
+            yield path
+            if dest is not None:
+                yield dest
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise Cancelled()
+
+    def progress(self, files, size):
+        with self.lock:
+            self.files += files
+            self.bytes += size
+
+    def run(self):
+        self.started = time.monotonic()
+        try:
+            total_files = 0
+            total_bytes = 0
+            for action, path, dest in self.operations:
+                if action == 'delete' or (action == 'move' and is_same_device(path, dest)):
+                    # Renaming is instant however big the path is, and so
+                    # is deleting as it comes down to renaming
+                    files, size = 1, 0
+                else:
+                    files, size = self.measure(path, action == 'copy')
+                total_files += files
+                total_bytes += size
+            self.total_files = total_files
+            self.total_bytes = total_bytes
+
+            for action, path, dest in self.operations:
+                self.check()
+                match action:
+                    case 'move':
+                        self.move(path, dest)
+                    case 'copy':
+                        self.copy(path, dest, True)
+                    case 'delete':
+                        self.delete(path)
+                        self.progress(1, 0)
+        except Cancelled:
+            pass
+        except OSError as e:
+            self.error = e
+
+    def measure(self, path, follow_symlinks):
+        if self.cancelled.is_set() or not path.is_dir() or (
+            not follow_symlinks and path.is_symlink()
+        ):
+            try:
+                return 1, path.stat(follow_symlinks=follow_symlinks).st_size
+            except OSError:
+                return 1, 0
+
+        files = 0
+        size = 0
+        stack = [path]
+        while stack and not self.cancelled.is_set():
+            try:
+                it = os.scandir(stack.pop())
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=follow_symlinks):
+                            stack.append(entry.path)
+                            continue
+                        files += 1
+                        size += entry.stat(follow_symlinks=follow_symlinks).st_size
+                    except OSError:
+                        pass
+        return files, size
+
+    def move(self, path, dest):
+        check_free(dest)
+        try:
+            path.rename(dest)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Another filesystem, copy and delete like shutil.move does
+            self.copy(path, dest, False)
+            self.delete(path)
+        else:
+            self.progress(1, 0)
+
+    def copy(self, path, dest, follow_symlinks):
+        check_free(dest)
+        try:
+            if not follow_symlinks and path.is_symlink():
+                os.symlink(os.readlink(path), dest)
+                self.progress(1, 0)
+            elif path.is_dir():
+                self.copy_tree(path, dest, follow_symlinks)
+            else:
+                self.copy_file(path, dest)
+                if follow_symlinks:
+                    shutil.copymode(path, dest)
+                else:
+                    shutil.copystat(path, dest)
+        except Cancelled:
+            # Do not leave half a copy behind
+            if dest.is_dir() and not dest.is_symlink():
+                shutil.rmtree(dest, ignore_errors=True)
+            else:
+                dest.unlink(missing_ok=True)
+            raise
+
+    def copy_tree(self, path, dest, follow_symlinks):
+        # Directories are created in order here while their files are copied
+        # by a pool of threads, with symlinks followed like shutil.copytree
+        # does unless moving
+        dirs = []
+        stack = [(path, dest)]
+
+        with ThreadPoolExecutor(COPY_THREADS) as executor:
+            pending = set()
+            try:
+                while stack:
+                    path, dest = stack.pop()
+                    os.mkdir(dest)
+                    dirs.append((path, dest))
+
+                    with os.scandir(path) as it:
+                        entries = list(it)
+
+                    for entry in entries:
+                        self.check()
+                        target = os.path.join(dest, entry.name)
+
+                        if not follow_symlinks and entry.is_symlink():
+                            os.symlink(os.readlink(entry.path), target)
+                            self.progress(1, 0)
+                            continue
+                        if entry.is_dir():
+                            stack.append((entry.path, target))
+                            continue
+
+                        if len(pending) >= COPY_QUEUE_SIZE:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                future.result()
+                        pending.add(executor.submit(self.copy_tree_file, entry.path, target))
+
+                for future in pending:
+                    future.result()
+            except BaseException:
+                # Stop the copies that are still running
+                self.cancelled.set()
+                raise
+
+        # Copying files into a directory changes its times, so these go last
+        for path, dest in reversed(dirs):
+            shutil.copystat(path, dest)
+
+    def copy_tree_file(self, path, dest):
+        self.copy_file(path, dest)
+        shutil.copystat(path, dest)
+
+    def copy_file(self, path, dest):
+        with open(path, 'rb') as src, open(dest, 'xb') as dst:
+            src_fd = src.fileno()
+            dst_fd = dst.fileno()
+
+            if clone(src_fd, dst_fd):
+                self.progress(1, os.fstat(src_fd).st_size)
+                return
+
+            for kernel_copy in KERNEL_COPIES:
+                copied = 0
+                try:
+                    while size := kernel_copy(src_fd, dst_fd, COPY_CHUNK_SIZE):
+                        copied += size
+                        self.progress(0, size)
+                        self.check()
+                except OSError as e:
+                    if copied or e.errno not in UNSUPPORTED_ERRNOS:
+                        raise
+                else:
+                    # Some special files claim to be empty to the kernel
+                    if copied or not os.fstat(src_fd).st_size:
+                        self.progress(1, 0)
+                        return
+                    break
+
+            while chunk := src.read(COPY_CHUNK_SIZE):
+                self.check()
+                dst.write(chunk)
+                self.progress(0, len(chunk))
+        self.progress(1, 0)
+
+    def delete(self, path):
+        if (staged := stage(path)) is not None:
+            RECLAIMER.reclaim(staged)
+        elif path.is_symlink() or not path.is_dir():
+            path.unlink()
+        else:
+            # Nowhere to stage it, so delete it here and now
+            for root, dirs, files in os.walk(path, topdown=False):
+                for name in files:
+                    self.check()
+                    os.unlink(os.path.join(root, name))
+                for name in dirs:
+                    # Symlinks to directories are listed as directories
+                    child = os.path.join(root, name)
+                    if os.path.islink(child):
+                        os.unlink(child)
+                    else:
+                        os.rmdir(child)
+            os.rmdir(path)
+
+    def describe(self):
+        text = VERBS[self.kind]
+        if self.total_files is None:
+            return f'{text}, counting files'
+
+        text += f' {self.files}/{self.total_files} files'
+        if self.total_bytes:
+            text += f', {format_size(self.bytes)}/{format_size(self.total_bytes)}'
+            if elapsed := time.monotonic() - self.started:
+                text += f', {format_size(self.bytes / elapsed)}/s'
+        return text
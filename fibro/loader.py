@@ -0,0 +1,42 @@
+import codecs
+import io
+import locale
+import mmap
+import os
+
+
+# Files with a nul byte in their first few KB are considered binary
+SNIFF_SIZE = 8 * 1024
+
+
+def get_decoder():
+    # The same decoding as Path.read_text, including universal newlines
+    return io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder(locale.getpreferredencoding(False))(),
+        translate=True,
+    )
+
+
+def load_text(path, max_size):
+    with path.open('rb') as f:
+        head = f.read(SNIFF_SIZE)
+        if b'\0' in head:
+            raise ValueError('binary content')
+
+        size = os.fstat(f.fileno()).st_size
+        truncated = size > max_size
+
+        if not truncated:
+            data = head + f.read(max_size - len(head))
+        else:
+            # Only the head gets highlighted, so map the file instead of
+            # reading it and cut the head at a line boundary if there is one
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    end = mm.rfind(b'\n', 0, max_size) + 1 or max_size
+                    data = mm[:end]
+            except (OSError, ValueError):
+                data = head + f.read(max_size - len(head))
+
+    # A truncated head can end halfway through a character
+    return get_decoder().decode(data, final=not truncated), truncated
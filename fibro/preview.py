@@ -1,10 +1,22 @@
 import subprocess
 
+from textual import work
 from textual.widget import Widget
 from textual.widgets import Static
+from textual.worker import get_current_worker
 
+from . import config, git, trace
+from .cache import SizedCache, get_stat_signature
 from .directory import Directory
-from .highlight import Highlight
+from .loader import load_text
+
+
+# Files larger than this only have their head previewed
+MAX_SIZE = config.get_option('preview', 'max-size', default=1024 * 1024)
+# Budget for keeping previews of recently seen files around, this is
+# measured in an estimate of the memory they use
+CACHE_SIZE = config.get_option('preview', 'cache-size', default=128 * 1024 * 1024)
+PREVIEW_DELAY = 0.05
 
 
 LANGUAGES = {
@@ -27,10 +39,35 @@ LANGUAGES = {
 }
 
 
+PREVIEW_CACHE = SizedCache(CACHE_SIZE)
+
+
+def get_signature(path, git_root):
+    if (signature := get_stat_signature(path)) is None:
+        return None
+    # The index blob determines what the gutter is compared to
+    oid = git.get_oid(git_root, path) if git_root else None
+    return signature, oid
+
+
+def get_cached_document(path):
+    # Whatever document we had for the path, even if it is outdated
+    match PREVIEW_CACHE.get_outdated(path):
+        case ('document', document, _):
+            return document
+        case _:
+            return None
+
+
 class Preview(Widget):
 
     path = None
 
+    def __init__(self):
+        super().__init__()
+        self.preview = ('empty',)
+        self.preview_timer = None
+
     def on_mount(self):
         browser = self.screen.query_one('Browser')
 
@@ -41,6 +78,16 @@ class Preview(Widget):
         self.watch(browser, 'path', self.set_browser_path)
         self.watch(browser, 'selected_value', self.set_browser_selected_value)
 
+        self.call_after_refresh(self.load_highlight)
+
+    # Highlighting pulls in tree-sitter and all grammars, which is only
+    # needed once a file is previewed, so it is imported in the background
+    # after the first paint
+    @work(thread=True, group='load_highlight')
+    def load_highlight(self):
+        from . import highlight  # noqa: F401
+        self.app.call_from_thread(self.app.mark_startup, 'highlight loaded')
+
     def set_browser_path(self, browser_path):
         self.browser_path = browser_path
         self.set_path()
@@ -60,33 +107,112 @@ class Preview(Widget):
 
         if path != self.path:
             self.path = path
-            self.refresh(recompose=True)
-
-    def compose(self):
-        if self.path is None:
-            yield Static('')
-
-        elif self.path.is_dir():
-            yield Directory(self.path)
+            self.reload()
+
+    def reload(self):
+        # Wait for the selection to settle before loading anything
+        if self.preview_timer is not None:
+            self.preview_timer.stop()
+        self.preview_timer = self.set_timer(PREVIEW_DELAY, self.start_preview)
+
+    def start_preview(self):
+        self.preview_timer = None
+        self.load_preview(self.path)
+
+    @work(thread=True, exclusive=True, group='preview')
+    def load_preview(self, path):
+        worker = get_current_worker()
+        with trace.span('preview', path=path):
+            preview = self.get_preview(worker, path)
+        if not worker.is_cancelled:
+            self.app.call_from_thread(self.finish_preview, worker, path, preview)
+
+    def get_preview(self, worker, path):
+        if path is None:
+            return ('empty',)
+
+        elif path.is_dir():
+            return ('directory', path)
+
+        elif path.is_file():
+            git_root = git.get_root(path.parent)
+            signature = get_signature(path, git_root)
+            if signature is not None and (preview := PREVIEW_CACHE.get(path, signature)):
+                return preview
 
-        elif self.path.is_file():
             try:
-                new_content = self.path.read_text()
+                new_content, truncated = load_text(path, MAX_SIZE)
             except ValueError:
-                yield Static('<binary>')
-            else:
-                browser = self.app.query_one('Browser')
-                if browser.git_root:
-                    git_path = self.path.relative_to(browser.git_root)
+                return ('binary',)
+
+            if worker.is_cancelled:
+                return None
+
+            if truncated:
+                # Diffing against the index would need the whole file
+                old_content = new_content
+            elif git_root and not git.is_clean(git_root, path):
+                git_path = path.relative_to(git_root)
+                with trace.span('git show', path=git_path):
                     res = subprocess.run(
                         ['git', 'show', f':{git_path}'],
-                        cwd=browser.git_root,
+                        cwd=git_root,
                         capture_output=True,
                     )
-                    old_content = res.stdout.decode()
-                else:
-                    old_content = new_content
+                old_content = res.stdout.decode()
+            else:
+                old_content = new_content
+
+            if worker.is_cancelled:
+                return None
+
+            from .highlight import Document
+
+            # Parsing can continue from the previous version of the file
+            document = Document(
+                old_content,
+                new_content,
+                LANGUAGES.get(path.suffix),
+                get_cached_document(path),
+            )
+            # Highlight the first screen here as well
+            if document.lines:
+                document.get_block(0)
+
+            preview = ('document', document, truncated)
+            if signature is not None:
+                PREVIEW_CACHE.set(path, signature, preview, document.get_size())
+            return preview
+
+        else:
+            return ('empty',)
+
+    def finish_preview(self, worker, path, preview):
+        # Only show the preview if it is still for what is selected
+        if worker.is_cancelled or path != self.path:
+            return
+        self.preview = preview
+        self.refresh(recompose=True)
+
+    async def recompose(self):
+        with trace.span('preview recompose'):
+            await super().recompose()
+
+    def compose(self):
+        self.parent.border_subtitle = None
+
+        match self.preview:
+            case ('directory', path):
+                yield Directory(path)
+
+            case ('binary',):
+                yield Static('<binary>')
 
-                language = LANGUAGES.get(self.path.suffix)
-                yield Highlight(old_content, new_content, language)
+            case ('document', document, truncated):
+                if truncated:
+                    self.parent.border_subtitle = 'truncated'
+                from .highlight import Highlight
+                yield Highlight(document)
 
+            case _:
+                yield Static('')
@@ -0,0 +1,128 @@
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_right
+from contextlib import nullcontext
+
+
+# Finished spans while tracing, or None if tracing is off
+SPANS = None
+START = time.perf_counter_ns()
+
+NULL_SPAN = nullcontext()
+
+# Upper bounds in ms of the buckets in the summary
+BUCKETS = [1, 4, 16, 64, 256, 1024]
+
+
+class Span:
+
+    def __init__(self, spans, name, args):
+        # Tracing can finish while a span is still open in another thread,
+        # the span then ends up in a list nobody looks at anymore
+        self.spans = spans
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *_):
+        thread = threading.current_thread()
+        self.spans.append((
+            self.name,
+            self.start,
+            time.perf_counter_ns() - self.start,
+            thread.ident,
+            thread.name,
+            self.args,
+        ))
+
+
+def span(name, **args):
+    spans = SPANS
+    if spans is None:
+        return NULL_SPAN
+    return Span(spans, name, args)
+
+
+def start():
+    global SPANS
+    SPANS = []
+
+
+def finish(path, summary=sys.stderr):
+    global SPANS
+
+    spans = SPANS
+    SPANS = None
+    if spans is None:
+        return
+
+    pid = os.getpid()
+    events = []
+    thread_names = {}
+
+    for name, start, duration, thread_id, thread_name, args in spans:
+        thread_names[thread_id] = thread_name
+        events.append({
+            'name': name,
+            'ph': 'X',
+            'ts': (start - START) / 1000,
+            'dur': duration / 1000,
+            'pid': pid,
+            'tid': thread_id,
+            'args': {key: str(value) for key, value in args.items()},
+        })
+
+    for thread_id, thread_name in thread_names.items():
+        events.append({
+            'name': 'thread_name',
+            'ph': 'M',
+            'pid': pid,
+            'tid': thread_id,
+            'args': {'name': thread_name},
+        })
+
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    write_summary(spans, summary)
+
+
+def write_summary(spans, f):
+    durations = {}
+    for name, _, duration, *_ in spans:
+        durations.setdefault(name, []).append(duration / 1_000_000)
+
+    headers = [f'<{bound}ms' for bound in BUCKETS] + [f'>={BUCKETS[-1]}ms']
+    width = max((len(name) for name in durations), default=4)
+
+    print(
+        'span'.ljust(width),
+        f'{"count":>7} {"total":>10} {"p50":>8} {"p90":>8} {"p99":>8} {"max":>8}',
+        *(f'{header:>8}' for header in headers),
+        file=f,
+    )
+
+    for name, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        values.sort()
+        counts = [0 for _ in headers]
+        for value in values:
+            counts[bisect_right(BUCKETS, value)] += 1
+
+        print(
+            name.ljust(width),
+            f'{len(values):>7} {sum(values):>10.1f}',
+            *(f'{get_percentile(values, p):>8.2f}' for p in [50, 90, 99]),
+            f'{values[-1]:>8.2f}',
+            *(f'{count:>8}' for count in counts),
+            file=f,
+        )
+
+
+def get_percentile(values, percentile):
+    return values[min(len(values) * percentile // 100, len(values) - 1)]